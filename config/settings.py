@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # สร้าง path ภายในโปรเจค เช่น: BASE_DIR / 'subdir'.
@@ -105,6 +106,91 @@ DATABASES = {
 }
 
 
+# Cache (ใช้เก็บข้อมูลที่คำนวณแล้วของหน้า Dashboard ดู queue_app/dashboard_cache.py)
+# - ตั้ง REDIS_URL (เช่น redis://redis:6379/0) เมื่อรันหลาย Process ให้ทุก Worker และ Scheduler ใช้ Cache ร่วมกัน
+# - ไม่ตั้ง: ใช้ Cache ใน Memory ของแต่ละ Process (พอสำหรับ runserver แบบ Process เดียว)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'queue-dashboard',
+        }
+    }
+# อายุสูงสุดของข้อมูล Dashboard ใน Cache (วินาที) ปกติถูกล้างทันทีเมื่อข้อมูลเปลี่ยน (queue version)
+# ค่านี้เป็นเพดานความค้างของข้อมูลกรณีใช้ Cache แยกต่อ Process หรือมีการแก้ข้อมูลนอกระบบ
+DASHBOARD_CACHE_TIMEOUT = 30
+# Server-Sent Events (/events/) แจ้งหน้าจอเมื่อคิวเปลี่ยน (ดู queue_app/events.py)
+# - SSE_MAX_CLIENTS: จำนวนหน้าจอที่เชื่อมต่อพร้อมกันได้ต่อ Process (เกินแล้วหน้าจอจะกลับไป Refresh ทุก 1 นาที)
+#   แต่ละหน้าจอใช้ 1 Thread ของ Web server ตลอดการเชื่อมต่อ (gunicorn: workers x threads ต้องมากกว่านี้)
+# - SSE_STREAM_SECONDS: ปิด Stream แล้วให้ Browser เชื่อมต่อใหม่ทุกกี่วินาที (คืน Thread ให้ Worker เป็นระยะ)
+# - SSE_HEARTBEAT_SECONDS: ส่งข้อความ keepalive ทุกกี่วินาทีระหว่างไม่มีการเปลี่ยนแปลง
+SSE_MAX_CLIENTS = 50
+SSE_STREAM_SECONDS = 300
+SSE_HEARTBEAT_SECONDS = 15
+
+
+# แหล่งข้อมูลใบงาน BMS (ดู queue_app/bms_sources.py)
+# - MSSQL (ระบบจริง): {'ENGINE': 'mssql', 'SERVER': ..., 'DATABASE': ..., 'USERNAME': ..., 'PASSWORD': ...}
+# - SQLite (ทดสอบ/Benchmark แบบ Offline): {'ENGINE': 'sqlite', 'PATH': BASE_DIR / 'bms.sqlite3'}
+# - ไฟล์ CSV/JSON: {'ENGINE': 'file', 'PATH': BASE_DIR / 'jobs.csv'}
+BMS_SOURCE = {
+    'ENGINE': 'mssql',
+    'SERVER': '173.16.200.103',
+    'DATABASE': 'BMSDB',
+    'USERNAME': 'kanchana_a',
+    'PASSWORD': 'Bms@2025',
+    # Connection Pool ไป MSSQL: จำนวน Connection ที่เก็บไว้ใช้ซ้ำ และอายุสูงสุดก่อนเชื่อมต่อใหม่ (วินาที)
+    'POOL_SIZE': 1,
+    'MAX_AGE': 3600,
+}
+
+# การตั้งค่าการ Sync ข้อมูลจาก BMS (MSSQL)
+# Incremental Sync: ดึงเฉพาะใบงานที่มีการเปลี่ยนแปลงหลัง watermark ล่าสุด
+# และทำ Full Sync ทุกๆ BMS_FULL_SYNC_INTERVAL วินาที เพื่อเก็บตกรายการที่ไม่มีวันที่เปลี่ยน (เช่น แก้ไขแค่หมายเหตุ)
+BMS_FULL_SYNC_INTERVAL = 600
+# ย้อน watermark กลับไปเล็กน้อย (วินาที) เผื่อเวลาของเครื่อง BMS และการ commit ที่ช้ากว่ากัน
+BMS_WATERMARK_OVERLAP = 60
+# จำนวนแถวที่อ่านจาก MSSQL และบันทึกลง DB ต่อ 1 รอบ (fetchmany) ยิ่งน้อยยิ่งใช้ Memory น้อย
+BMS_SYNC_BATCH_SIZE = 500
+# รอบการ Sync แบบปรับตามสถานการณ์ (Adaptive interval, ดู queue_app/scheduler.py) หน่วยวินาที
+# - ปกติ Sync ทุก BMS_SYNC_INTERVAL
+# - พบการเปลี่ยนแปลงหรือมีคนกด Sync ทันที: เร่งเป็นทุก BMS_SYNC_BURST_INTERVAL ต่อเนื่อง BMS_SYNC_BURST_RUNS รอบ
+# - ไม่มีการเปลี่ยนแปลงติดกันเกิน BMS_SYNC_IDLE_RUNS รอบ หรือปิดกะอยู่: ยืดรอบออกทีละ 2 เท่า สูงสุด BMS_SYNC_MAX_INTERVAL
+# Scheduler ตรวจว่าถึงรอบหรือยังทุก BMS_SYNC_TICK วินาที (เป็นความละเอียดของรอบและความเร็วในการตอบสนองการกด Sync)
+BMS_SYNC_INTERVAL = 20
+BMS_SYNC_BURST_INTERVAL = 5
+BMS_SYNC_BURST_RUNS = 6
+BMS_SYNC_IDLE_RUNS = 3
+BMS_SYNC_MAX_INTERVAL = 120
+BMS_SYNC_TICK = 5
+# ประวัติการ Sync (SyncRun): เก็บย้อนหลังกี่วัน และถ้าไม่มีรอบที่สำเร็จเกินกี่วินาทีให้ถือว่าข้อมูลค้าง (/health/)
+SYNC_RUN_RETENTION_DAYS = 7
+SYNC_STALE_AFTER = 120
+# รหัส PostgreSQL Advisory Lock สำหรับเลือก Process เดียวที่รัน Scheduler (ดู queue_app/leader.py)
+# ทุก Process/Container ที่ต่อฐานข้อมูลเดียวกันต้องใช้ค่าเดียวกัน
+SCHEDULER_LEADER_LOCK_KEY = 58860001
+# รหัส Advisory Lock ที่ถือระหว่างบันทึก QueueEvent ให้ id เรียงตามลำดับ Commit (ดู queue_app/queue_log.py)
+QUEUE_EVENT_LOCK_KEY = 58860002
+# จำนวน Event สูงสุดที่ /api/changes/ ส่งต่อ 1 ครั้ง (ที่เหลือให้ Client ขอต่อด้วย since=<version ที่ได้>)
+QUEUE_CHANGES_PAGE_SIZE = 500
+
+# รูปแบบเลขคิว (ดู queue_app/queue_numbers.py)
+# QUEUE_NUMBER_FORMAT ใช้ได้ {prefix}, {number} และ {period} (รหัสรอบ เช่น 20261018) เช่น '{prefix}{period}-{number:03d}'
+# QUEUE_NUMBER_RESET: 'never' (รันต่อเนื่อง), 'daily', 'monthly', 'yearly' (ถ้ารีเซ็ต ต้องมี {period} ใน FORMAT)
+# ไม่รีเซ็ตเลขจึงใช้ 5 หลัก (IT-00001 .. IT-99999) เลขคิวเดิม 4 หลักยังใช้ได้ รายการคิวเรียงตาม id ไม่ใช่ตาม String เลขคิว
+QUEUE_NUMBER_PREFIX = 'IT-'
+QUEUE_NUMBER_FORMAT = '{prefix}{number:05d}'
+QUEUE_NUMBER_RESET = 'never'
+
+
 # การตรวจสอบความปลอดภัยของรหัสผ่าน
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# DJANGO_SERVE_STATIC=1: ให้ WSGI Server (gunicorn) เสิร์ฟไฟล์ Static เองแบบเดียวกับ runserver
+# ใช้ใน Production profile ของ docker-compose ที่ไม่มี Web server (nginx) แยกหน้า
+if os.environ.get('DJANGO_SERVE_STATIC') == '1':
+    from django.contrib.staticfiles.handlers import StaticFilesHandler
+    application = StaticFilesHandler(application)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import QueueItem, QueueStatus
+from .models import QueueEvent, QueueItem, QueueStatus, SyncRun
 
 @admin.register(QueueStatus)
 class QueueStatusAdmin(admin.ModelAdmin):
@@ -18,3 +18,24 @@ class QueueItemAdmin(admin.ModelAdmin):
     )
     list_filter = ('status', 'user_department')
     search_fields = ('queue_number', 'user_name', 'issue_description')
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'finished_at',
+        'mode',
+        'success',
+        'rows_fetched',
+        'rows_changed',
+        'queue_items_created',
+        'statuses_updated',
+    )
+    list_filter = ('success', 'mode')
+    readonly_fields = [field.name for field in SyncRun._meta.fields]
+
+@admin.register(QueueEvent)
+class QueueEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'queue_number', 'event_type', 'old_value', 'new_value', 'actor')
+    list_filter = ('event_type',)
+    search_fields = ('queue_number', 'actor')
+    readonly_fields = [field.name for field in QueueEvent._meta.fields]
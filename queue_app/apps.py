@@ -9,8 +9,16 @@ class QueueAppConfig(AppConfig):
         import os
         from . import scheduler
         
+        # QUEUE_SCHEDULER_AUTOSTART=1 : เปิด scheduler ในทุก Process ที่โหลดแอป เช่น Worker ของ gunicorn/uvicorn
+        #   ทุก Worker เปิด scheduler แต่มีเพียง Worker ที่เป็น Leader (ถือ Advisory Lock) ที่รัน Job จริง (ดู leader.py)
+        # QUEUE_SCHEDULER_AUTOSTART=0 : ไม่เปิดเลย
+        autostart = os.environ.get('QUEUE_SCHEDULER_AUTOSTART')
+        if autostart is not None:
+            if autostart == '1':
+                scheduler.start()
+            return
+
         # ป้องกันไม่ให้ scheduler รันซ้ำ 2 รอบ เวลาใช้ runserver ที่มี autoreload
         # RUN_MAIN จะถูก set โดย auto-reloader ของ Django
         if os.environ.get('RUN_MAIN', None) == 'true':
             scheduler.start()
-
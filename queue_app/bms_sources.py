@@ -0,0 +1,243 @@
+"""
+แหล่งข้อมูลใบงาน BMS (Source adapters) ที่ sync_jobs_from_mssql ใช้ดึงข้อมูล
+ทุกแหล่งให้ Cursor แบบ DB-API (paramstyle '?') ที่รัน Query เดียวกัน (JOB_SELECT_SQL ใน utils.py) ได้
+- MssqlSource: ฐานข้อมูล BMS จริง (SQL Server ผ่าน pyodbc + Connection Pool)
+- SqliteSource: ไฟล์ SQLite ที่มีตาราง jobs / employee / m_dept โครงสร้างเดียวกับ BMS (ใช้ทดสอบ/Benchmark แบบ Offline)
+- FileSource: ไฟล์ CSV หรือ JSON ของใบงาน โหลดเข้า SQLite ใน Memory แล้วใช้แบบ SqliteSource
+Driver ของแต่ละแหล่ง (เช่น pyodbc) import เมื่อใช้งานแหล่งนั้นจริงเท่านั้น ไม่ต้องติดตั้งครบทุกตัวเพื่อรันคำสั่งอื่นๆ
+เลือกแหล่งข้อมูลได้ที่ settings.BMS_SOURCE
+"""
+import abc
+import csv
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .connection_pool import ConnectionPool
+
+# ตารางจำลองของ BMS (เฉพาะคอลัมน์ที่ Sync ใช้) สำหรับ SqliteSource / FileSource และคำสั่ง Benchmark
+JOBS_COLUMNS = [
+    'jobno', 'catagory', 'description', 'dept_tech', 'emp_id', 'dept', 'jobdate', 'assign_date',
+    'arrive_date', 'req_date', 'caller', 'sap_code', 'aname', 'note', 'act_dstart', 'act_dfin',
+    'job_status', 'return_date', 'enterdate', 'enterby', 'outsource_date', 'dept_control',
+]
+TIMESTAMP_COLUMNS = [
+    'jobdate', 'assign_date', 'arrive_date', 'req_date', 'act_dstart', 'act_dfin',
+    'return_date', 'enterdate', 'outsource_date',
+]
+STAND_IN_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        jobno INTEGER PRIMARY KEY, catagory TEXT, description TEXT, dept_tech TEXT, emp_id INTEGER,
+        dept TEXT, jobdate TIMESTAMP, assign_date TIMESTAMP, arrive_date TIMESTAMP, req_date TIMESTAMP,
+        caller TEXT, sap_code TEXT, aname TEXT, note TEXT, act_dstart TIMESTAMP, act_dfin TIMESTAMP,
+        job_status TEXT, return_date TIMESTAMP, enterdate TIMESTAMP, enterby TEXT,
+        outsource_date TIMESTAMP, dept_control TEXT
+    );
+    CREATE TABLE IF NOT EXISTS employee (emp_id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE IF NOT EXISTS m_dept (dept TEXT PRIMARY KEY, abb_desc TEXT, descriptions TEXT);
+"""
+
+
+class BmsSource(abc.ABC):
+    """
+    Interface ของแหล่งข้อมูล BMS (สร้าง Object ได้เฉพาะ Subclass ที่ Implement connection() แล้ว)
+    - ids_subquery: Subquery ที่แปลง JSON array ของ jobno (1 Parameter) เป็นตาราง
+    - connection(): Context manager ที่คืน Connection (DB-API) สำหรับรอบ Sync หนึ่งรอบ
+    """
+    name = None
+    ids_subquery = None
+
+    @abc.abstractmethod
+    def connection(self):
+        """ Context manager (@contextmanager) ที่ yield Connection แบบ DB-API """
+
+    def snapshot(self):
+        """ สถิติของ Connection (ถ้ามี) สำหรับ /metrics """
+        return {}
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+class MssqlSource(BmsSource):
+    """ ฐานข้อมูล BMS จริงบน SQL Server ใช้ Connection Pool ร่วมกันทั้ง Process """
+    name = 'mssql'
+    # Subquery แปลง JSON array ของ jobno เป็นตาราง (OPENJSON, SQL Server 2016+)
+    ids_subquery = "SELECT CAST(value AS INT) FROM OPENJSON(?)"
+
+    def __init__(self, server, database, username, password, pool_size=1, max_age=3600):
+        self.server = server
+        self.database = database
+        self.username = username
+        self.password = password
+        # Pool ของ Connection ไป BMS (Scheduler รัน Sync ทีละรอบ จึงใช้ 1 Connection เป็นหลัก)
+        self.pool = ConnectionPool(self.connect, size=pool_size, max_age=max_age, name=self.name)
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            yield conn
+
+    def snapshot(self):
+        return self.pool.snapshot()
+
+    def close(self):
+        self.pool.close_all()
+
+    def connect(self):
+        """
+        เปิด Connection ใหม่ไปยัง Server BMS (ปกติเรียกผ่าน Pool)
+        raise Exception ถ้าเชื่อมต่อไม่ได้
+        """
+        import pyodbc
+
+        driver = get_mssql_driver()
+        # สร้าง Connection String (รองรับ TrustServerCertificate สำหรับ Self-signed SSL)
+        # ใช้ autocommit เพื่อไม่ให้ Connection ที่เปิดค้างไว้ใน Pool ถือ Transaction ค้างที่ฝั่ง BMS
+        conn_str = (
+            f'DRIVER={{{driver}}};SERVER={self.server};DATABASE={self.database};'
+            f'UID={self.username};PWD={self.password};TrustServerCertificate=yes'
+        )
+        try:
+            return pyodbc.connect(conn_str, autocommit=True)
+        except Exception as e:
+            print(f"Error connecting to MSSQL: {e}")
+            raise
+
+
+@lru_cache(maxsize=1)
+def get_mssql_driver():
+    """
+    หา ODBC Driver ของ SQL Server ที่ติดตั้งในเครื่อง (สแกนครั้งเดียวแล้วจำไว้ ไม่ต้องสแกนทุกรอบ Sync)
+    """
+    import pyodbc
+
+    drivers = [driver for driver in pyodbc.drivers() if 'SQL Server' in driver]
+    if not drivers:
+        # raise แทนการคืน None เพื่อไม่ให้ lru_cache จำผลลัพธ์ที่ไม่พบ Driver ไว้
+        raise RuntimeError("No SQL Server ODBC drivers found!")
+
+    # เลือกรุ่นใหม่กว่า (เช่น ODBC Driver 17/18) ก่อนรุ่นเก่า (SQL Server legacy driver)
+    # เพราะรุ่นเก่าอาจมีปัญหากับ TrustServerCertificate
+    newer_drivers = [d for d in drivers if 'ODBC Driver' in d]
+    return newer_drivers[-1] if newer_drivers else drivers[0]
+
+
+class SqliteSource(BmsSource):
+    """ ไฟล์ SQLite ที่มีตาราง jobs / employee / m_dept (คอลัมน์วันที่ประกาศเป็น TIMESTAMP) """
+    name = 'sqlite'
+    ids_subquery = "SELECT CAST(value AS INT) FROM json_each(?)"
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def connect(self):
+        # PARSE_DECLTYPES: แปลงคอลัมน์ TIMESTAMP เป็น datetime เหมือนที่ได้จาก pyodbc
+        return sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+class FileSource(SqliteSource):
+    """
+    ไฟล์ CSV (มี Header) หรือ JSON (Array ของ Object) ของใบงาน 1 แถวต่อ 1 ใบงาน
+    ใช้ชื่อคอลัมน์ตาราง jobs (JOBS_COLUMNS) และใส่ name / abb_desc / descriptions มาในแถวได้เลย (แทนการ JOIN)
+    โหลดเข้า SQLite ใน Memory ใหม่เมื่อไฟล์ถูกแก้ไข (เช็คจากเวลาแก้ไขไฟล์)
+    """
+    name = 'file'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._loaded_mtime = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            if self._conn is None or mtime != self._loaded_mtime:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = self._load()
+                self._loaded_mtime = mtime
+            yield self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def read_rows(self):
+        if self.path.lower().endswith('.json'):
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        with open(self.path, encoding='utf-8-sig', newline='') as f:
+            return list(csv.DictReader(f))
+
+    def _load(self):
+        conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.executescript(STAND_IN_SCHEMA)
+        employees = []
+        departments = []
+        jobs = []
+        for index, row in enumerate(self.read_rows(), start=1):
+            # ค่าว่างใน CSV ให้ถือเป็น NULL
+            row = {key: (None if value == '' else value) for key, value in row.items()}
+            # วันที่รูปแบบ ISO (เช่น 2026-10-18T08:30:00) ให้เก็บเป็น datetime ตรงกับคอลัมน์ TIMESTAMP
+            for column in TIMESTAMP_COLUMNS:
+                if isinstance(row.get(column), str):
+                    row[column] = datetime.fromisoformat(row[column])
+            # ชื่อช่าง / แผนกที่มากับแถว: สร้างแถวใน employee / m_dept ให้ JOIN ได้ (ใช้เลขแถวเป็นรหัสถ้าไม่ได้ระบุ)
+            if row.get('name') is not None:
+                row['emp_id'] = row.get('emp_id') or -index
+                employees.append((row['emp_id'], row['name']))
+            if row.get('abb_desc') is not None or row.get('descriptions') is not None:
+                row['dept'] = row.get('dept') or f'file-{index}'
+                departments.append((row['dept'], row.get('abb_desc'), row.get('descriptions')))
+            jobs.append([row.get(column) for column in JOBS_COLUMNS])
+
+        conn.executemany("INSERT OR REPLACE INTO employee VALUES (?, ?)", employees)
+        conn.executemany("INSERT OR REPLACE INTO m_dept VALUES (?, ?, ?)", departments)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO jobs VALUES ({', '.join(['?'] * len(JOBS_COLUMNS))})", jobs,
+        )
+        conn.commit()
+        return conn
+
+
+SOURCE_ENGINES = {
+    'mssql': MssqlSource,
+    'sqlite': SqliteSource,
+    'file': FileSource,
+}
+
+
+def build_source(config):
+    """ สร้าง Source จาก dict ตั้งค่ารูปแบบเดียวกับ settings.BMS_SOURCE เช่น {'ENGINE': 'sqlite', 'PATH': 'bms.sqlite'} """
+    config = dict(config)
+    engine = config.pop('ENGINE', 'mssql')
+    if engine not in SOURCE_ENGINES:
+        raise ImproperlyConfigured(f"BMS_SOURCE ENGINE must be one of {', '.join(SOURCE_ENGINES)} (got {engine!r})")
+    return SOURCE_ENGINES[engine](**{key.lower(): value for key, value in config.items()})
+
+
+@lru_cache(maxsize=1)
+def get_bms_source():
+    """ Source หลักของ Process ตาม settings.BMS_SOURCE (สร้างครั้งเดียว ใช้ Pool ร่วมกัน) """
+    return build_source(settings.BMS_SOURCE)
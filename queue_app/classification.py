@@ -0,0 +1,76 @@
+"""
+การจัดระดับความยาก (difficulty) และประเภทงาน (job_category_type) จากรายละเอียดอาการเสีย
+เดิมคำนวณด้วย CASE ... LIKE N'%...%' ใน Query ของ MSSQL (ซ้ำกัน 2 ที่) ย้ายมาคำนวณในฝั่ง Python
+- กฎทั้งหมดอยู่ในตารางเดียว (DIFFICULTY_RULES / CATEGORY_RULES) แก้ที่นี่ที่เดียว
+- ใช้ Regex ที่ compile ครั้งเดียวหาคำสำคัญทั้งหมดในรอบเดียว (Multi-pattern matching)
+- จำผลลัพธ์ตามข้อความ (lru_cache) เพราะรายละเอียดอาการเสียซ้ำกันบ่อย
+ถ้าแก้กฎ ให้รัน: python manage.py reclassify_jobs เพื่ออัปเดตข้อมูลเดิมใน JobsBms
+"""
+import re
+from functools import lru_cache
+
+# ระดับความยาก (1 = ง่ายที่สุด, 5 = ยากที่สุด)
+# ลำดับมีผล: ตรวจจากบนลงล่าง กฎแรกที่พบคำใดคำหนึ่งจะถูกใช้ (เหมือน CASE WHEN เดิม)
+DIFFICULTY_RULES = [
+    # ระดับ 5: ยากที่สุด (ระบบวิกฤต/ความปลอดภัย/โครงสร้างหลัก)
+    (5, ['ระบบล่ม', 'กู้ระบบ', 'security', 'server', 'firewall', 'database', 'ความปลอดภัย']),
+    # ระดับ 4: ค่อนข้างยาก (การติดตั้งใหญ่/ซ่อมซับซ้อน/กู้ข้อมูล)
+    (4, ['ติดตั้งระบบใหม่', 'เปลี่ยนอะไหล่', 'ซ่อมบอร์ด', 'ไวรัส', 'กู้ข้อมูล', 'คอมพิวเตอร์(ชำรุด)']),
+    # ระดับ 2: ค่อนข้างง่าย (การเชื่อมต่อ/ย้ายจุด/เน็ตพื้นฐาน)
+    (2, ['เพิ่มสายแลน', 'ย้ายโทรศัพท์', 'อินเทอร์เน็ต หลุด', 'อินเทอร์เน็ต ช้า', 'ไฟดับ']),
+    # ระดับ 1: ง่ายที่สุด (อุปกรณ์ต่อพ่วง/การตั้งค่าเล็กน้อย)
+    (1, ['ปรินเตอร์', 'พิมพ์ ไม่ได้', 'ตั้งค่า', 'เปลี่ยนรหัส', 'เมาส์', 'คีย์บอร์ด']),
+]
+# ระดับ 3: ปานกลาง (ค่าเริ่มต้น/ปัญหาทั่วไปที่ไม่เข้าข่ายระดับอื่น)
+DEFAULT_DIFFICULTY = 3
+
+# ประเภทงาน (ตรวจตามลำดับเช่นเดียวกัน)
+CATEGORY_RULES = [
+    ('SERVER', ['server', 'database', 'firewall', 'network core', 'ระบบล่ม', 'กู้ระบบ']),
+    ('APP', ['excel', 'word', 'windows', 'ลงโปรแกรม', 'ตั้งค่า', 'รหัส']),
+    ('ENDPOINT', ['คอม', 'computer', 'จอ', 'ปรินเตอร์', 'พิมพ์', 'เมาส์', 'คีย์บอร์ด', 'โทรศัพท์', 'สายแลน']),
+]
+DEFAULT_CATEGORY = 'OTHER'
+
+
+def _build_matcher():
+    """
+    สร้าง Regex เดียวจากคำสำคัญทั้งหมด (ตัวพิมพ์เล็ก เพราะ LIKE ของ MSSQL ไม่สนตัวพิมพ์)
+    - ใช้ lookahead (?=(...)) เพื่อให้หาเจอทุกตำแหน่งแม้คำจะซ้อนกัน
+    - เรียงคำยาวก่อน ตำแหน่งเดียวกันจะได้คำที่ยาวที่สุด และคำที่เป็นส่วนหนึ่งของคำนั้น
+      (เช่น 'รหัส' ใน 'เปลี่ยนรหัส') จะถูกนับรวมผ่านตาราง implied
+    """
+    keywords = {keyword.casefold() for _, words in DIFFICULTY_RULES + CATEGORY_RULES for keyword in words}
+    ordered = sorted(keywords, key=len, reverse=True)
+    pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in ordered) + '))')
+    implied = {keyword: frozenset(other for other in keywords if other in keyword) for keyword in keywords}
+    return pattern, implied
+
+
+_PATTERN, _IMPLIED = _build_matcher()
+
+
+def _first_rule(rules, found, default):
+    for value, words in rules:
+        if any(word.casefold() in found for word in words):
+            return value
+    return default
+
+
+@lru_cache(maxsize=4096)
+def classify_description(description):
+    """
+    คืนค่า (difficulty, job_category_type) ของรายละเอียดอาการเสีย
+    ผลลัพธ์ตรงกับ CASE ... LIKE เดิมใน MSSQL
+    """
+    if not description:
+        return DEFAULT_DIFFICULTY, DEFAULT_CATEGORY
+
+    found = set()
+    for match in _PATTERN.finditer(description.casefold()):
+        found |= _IMPLIED[match.group(1)]
+
+    return (
+        _first_rule(DIFFICULTY_RULES, found, DEFAULT_DIFFICULTY),
+        _first_rule(CATEGORY_RULES, found, DEFAULT_CATEGORY),
+    )
@@ -0,0 +1,137 @@
+"""
+Pool ของ Connection ไปยังฐานข้อมูลภายนอก (เช่น MSSQL ของ BMS) แบบใช้ซ้ำได้ (Long-lived)
+แทนการเปิด-ปิด Connection ใหม่ทุกรอบ Sync (ลดเวลา TLS Handshake ผ่าน WAN)
+- ตรวจสุขภาพ Connection ด้วย Query เบาๆ (ping) ก่อนนำกลับมาใช้ ถ้าเสียจะเชื่อมต่อใหม่ให้อัตโนมัติ
+- Connection ที่เกิด Error ระหว่างใช้งานจะถูกปิดทิ้ง ไม่คืนเข้า Pool
+- เก็บสถิติ (จำนวนการเชื่อมต่อ, การใช้ซ้ำ, เวลาในการเชื่อมต่อ) ผ่าน snapshot()
+  และถ้าตั้งชื่อ Pool (name) จะส่งเข้า /metrics ด้วย: เวลาเชื่อมต่อเป็น Histogram, จำนวนเหตุการณ์เป็น Counter
+"""
+import threading
+import time
+from contextlib import contextmanager
+from . import metrics
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=1, max_age=3600, ping_sql='SELECT 1', name=None):
+        """
+        connect: ฟังก์ชันที่คืนค่า Connection ใหม่ (DB-API) หรือ raise Exception ถ้าเชื่อมต่อไม่ได้
+        size: จำนวน Connection สูงสุดที่เก็บไว้ใน Pool
+        max_age: อายุสูงสุดของ Connection (วินาที) เกินแล้วจะเชื่อมต่อใหม่ (None = ไม่จำกัด)
+        name: ชื่อของ Pool ใน /metrics (label pool) ไม่ตั้ง = ไม่ส่ง Metrics
+        """
+        self._connect = connect
+        self.name = name
+        self.size = size
+        self.max_age = max_age
+        self.ping_sql = ping_sql
+        self._idle = []  # [(connection, created_at)]
+        self._lock = threading.Lock()
+        self._stats = {
+            'connects': 0,
+            'connect_failures': 0,
+            'reuses': 0,
+            'ping_failures': 0,
+            'discarded': 0,
+            'last_connect_seconds': None,
+            'total_connect_seconds': 0.0,
+        }
+
+    @contextmanager
+    def connection(self):
+        """
+        ยืม Connection จาก Pool ใช้คู่กับ with:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+        """
+        conn, created_at = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            self._close(conn)
+            raise
+        else:
+            self._release(conn, created_at)
+
+    def snapshot(self):
+        """ คืนค่าสถิติของ Pool ณ ปัจจุบัน (สำเนา dict) """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['avg_connect_seconds'] = (
+            stats['total_connect_seconds'] / stats['connects'] if stats['connects'] else None
+        )
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn, count=False)
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, created_at = self._idle.pop()
+
+            if self.max_age is not None and time.monotonic() - created_at > self.max_age:
+                self._close(conn)
+                continue
+            if self._ping(conn):
+                self._count('reuses')
+                return conn, created_at
+
+            self._count('ping_failures')
+            self._close(conn)
+
+        return self._open()
+
+    def _open(self):
+        started = time.perf_counter()
+        try:
+            conn = self._connect()
+        except Exception:
+            self._count('connect_failures')
+            raise
+        elapsed = time.perf_counter() - started
+        self._count('connects')
+        with self._lock:
+            self._stats['last_connect_seconds'] = elapsed
+            self._stats['total_connect_seconds'] += elapsed
+        if self.name:
+            metrics.POOL_CONNECT_SECONDS.observe(elapsed, pool=self.name)
+        return conn, time.monotonic()
+
+    def _release(self, conn, created_at):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, created_at))
+                return
+        self._close(conn)
+
+    def _ping(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _count(self, event):
+        """ เพิ่มตัวนับสะสมของเหตุการณ์ใน Pool (connects, reuses, ...) ทั้งใน snapshot() และ /metrics """
+        with self._lock:
+            self._stats[event] += 1
+        if self.name:
+            metrics.POOL_EVENTS.inc(pool=self.name, event=event)
+
+    def _close(self, conn, count=True):
+        if count:
+            self._count('discarded')
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,94 @@
+"""
+Cache ของข้อมูลที่คำนวณแล้วสำหรับหน้า Dashboard (Read model)
+- ทุก Key ผูกกับ "เวอร์ชันของคิว" (queue version) ตัวเดียวทั้งระบบ
+  ทุกจุดที่เขียนข้อมูลคิว (View, Sync, Scheduler) เรียก bump_queue_version() ทำให้ Key เดิมทั้งหมดหมดอายุทันที
+  ไม่ต้องไล่ลบ Key ทีละตัว
+- กัน Cache stampede (Dogpile): เมื่อ Key หมดอายุ มี Request เดียวที่ได้ Lock (cache.add) ไปคำนวณใหม่
+  Request อื่นระหว่างนั้นรอผลสั้นๆ แทนการยิง Query ซ้ำพร้อมกัน
+  ค่าสำรอง (Stale) ใช้ได้เฉพาะเมื่อเป็นเวอร์ชันเดียวกับที่ขอ (Key หมดอายุตาม timeout แต่ข้อมูลไม่เปลี่ยน)
+  ไม่ส่งข้อมูลของเวอร์ชันก่อนหน้าให้หน้าจอที่ได้รับแจ้งว่าข้อมูลเปลี่ยนแล้ว
+ใช้ Cache 'default' ของ Django: ถ้ามีหลาย Process (gunicorn หลาย Worker + run_scheduler) ต้องตั้ง REDIS_URL
+ให้ใช้ Cache ร่วมกัน ถ้าเป็น LocMemCache (แยกกันต่อ Process) ข้อมูลจะค้างได้ไม่เกิน DASHBOARD_CACHE_TIMEOUT วินาที
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .events import publish_queue_change
+
+VERSION_KEY = 'queue:version'
+# เวลาสูงสุดที่ให้ Request หนึ่งคำนวณค่าใหม่ (วินาที) ถ้า Process ตายระหว่างคำนวณ Lock จะหลุดเองหลังจากนี้
+BUILD_LOCK_TIMEOUT = 10
+# ถ้าไม่มีค่า Stale ให้ใช้ รอ Request ที่กำลังคำนวณอยู่ได้นานเท่านี้ (วินาที) ก่อนคำนวณเอง
+BUILD_WAIT = 2.0
+BUILD_POLL_INTERVAL = 0.05
+
+
+def get_queue_version():
+    """ คืนค่าเวอร์ชันปัจจุบันของข้อมูลคิว (สร้างใหม่ถ้ายังไม่มีใน Cache) """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # เริ่มจากเวลาปัจจุบัน (ms) ไม่ให้ซ้ำกับเวอร์ชันเดิมที่อาจยังมี Key ค้างอยู่ เมื่อ Cache ถูกล้างหรือ Restart
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_queue_version():
+    """
+    เรียกหลังเขียนข้อมูลคิว/ใบงาน/กะ ทำให้ข้อมูล Dashboard ใน Cache ทั้งหมดถูกคำนวณใหม่
+    และแจ้งหน้าจอที่เปิดอยู่ให้โหลดข้อมูลใหม่ (ดู events.py)
+    """
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key ยังไม่มี (เช่น Cache เพิ่ง Restart)
+        get_queue_version()
+        version = cache.incr(VERSION_KEY)
+    publish_queue_change(version)
+    return version
+
+
+def _fragment_key(name, parts):
+    digest = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    return f'dashboard:{name}:{digest}'
+
+
+def get_or_build(name, parts, build, timeout=None, version=None):
+    """
+    คืนค่าส่วนของ Dashboard ชื่อ name สำหรับพารามิเตอร์ parts (tuple) จาก Cache
+    ถ้าไม่มีหรือเวอร์ชันเปลี่ยนแล้ว จะเรียก build() คำนวณใหม่ (ทีละ Request ต่อ Key)
+    build() ต้องคืนค่าที่ Pickle ได้และไม่ใช่ None
+    version: เวอร์ชันของคิวที่ผู้เรียกอ่านไว้แล้ว (เช่นตอนคำนวณ ETag) ให้ผลตรงกับเวอร์ชันนั้น ถ้าไม่ระบุจะอ่านใหม่
+    """
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT if timeout is None else timeout
+    base_key = _fragment_key(name, parts)
+    if version is None:
+        version = get_queue_version()
+    key = f'{base_key}:{version}'
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=BUILD_LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(key, value, timeout)
+            # ค่าสำรองพร้อมเวอร์ชันที่คำนวณ ใช้ตอบ Request อื่นเมื่อ Key หมดอายุแต่เวอร์ชันยังไม่เปลี่ยน
+            cache.set(f'{base_key}:stale', (version, value), timeout * 10)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # มี Request อื่นกำลังคำนวณ: ใช้ค่าสำรองถ้าเป็นเวอร์ชันเดียวกัน ไม่เช่นนั้นรอผลสั้นๆ แล้วคำนวณเอง
+    stale = cache.get(f'{base_key}:stale')
+    if stale is not None and stale[0] == version:
+        return stale[1]
+    deadline = time.monotonic() + BUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return build()
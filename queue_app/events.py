@@ -0,0 +1,139 @@
+"""
+ช่องทางแจ้งการเปลี่ยนแปลงของคิวไปยังหน้าจอแบบ Real-time (Server-Sent Events) ผ่าน PostgreSQL LISTEN/NOTIFY
+- ผู้เขียนข้อมูล (View, Sync, Scheduler) เรียก publish_queue_change() -> NOTIFY ช่อง QUEUE_CHANNEL
+  NOTIFY ภายใน Transaction จะถูกส่งเมื่อ Commit เท่านั้น หน้าจอจึงไม่โหลดข้อมูลที่ยังไม่ Commit
+- แต่ละ Process ของเว็บมี Thread LISTEN เพียง 1 ตัว (QueueChangeListener) ใช้ Connection เฉพาะของตัวเอง
+  แล้วกระจายต่อให้ทุก Stream ของ /events/ ใน Process เดียวกันผ่าน threading.Condition
+  (ไม่ต้องเปิด Connection ไป PostgreSQL ต่อ 1 หน้าจอ)
+- Connection หลุด: เชื่อมต่อใหม่อัตโนมัติ และแจ้งหน้าจอให้โหลดใหม่ 1 ครั้ง (อาจพลาดการแจ้งระหว่างหลุด)
+"""
+import logging
+import select
+import threading
+import time
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+QUEUE_CHANNEL = 'queue_changes'
+# รอการแจ้งเตือนครั้งละไม่เกินกี่วินาที (ใช้ตรวจว่า Connection ยังอยู่และหยุด Thread ได้)
+LISTEN_POLL_SECONDS = 5
+RECONNECT_DELAY_SECONDS = 5
+
+
+def publish_queue_change(version=''):
+    """ แจ้งทุกหน้าจอว่าข้อมูลคิวเปลี่ยน (ส่งเมื่อ Transaction ปัจจุบัน Commit) ไม่ทำให้งานที่เรียกล้มถ้าส่งไม่ได้ """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [QUEUE_CHANNEL, str(version)])
+    except Exception as e:
+        logger.warning("Could not publish queue change: %s", e)
+
+
+class QueueChangeListener:
+    """
+    Thread เดียวต่อ Process ที่ LISTEN ช่อง QUEUE_CHANNEL
+    - sequence: นับจำนวนการแจ้งเตือนที่ได้รับ (Stream ใช้เทียบว่ามีอะไรใหม่ตั้งแต่ครั้งก่อน)
+    - version: ค่าที่ส่งมากับการแจ้งเตือนล่าสุด
+    """
+    def __init__(self, channel=QUEUE_CHANNEL, using='default'):
+        self.channel = channel
+        self.using = using
+        self.sequence = 0
+        self.version = ''
+        self._condition = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='queue-change-listener', daemon=True)
+                self._thread.start()
+
+    def wait(self, last_sequence, timeout):
+        """ รอจนกว่าจะมีการแจ้งเตือนใหม่หลัง last_sequence หรือหมดเวลา คืนค่า (sequence, version) ล่าสุด """
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence != last_sequence, timeout=timeout)
+            return self.sequence, self.version
+
+    def _publish(self, version):
+        with self._condition:
+            self.sequence += 1
+            self.version = version
+            self._condition.notify_all()
+
+    def _run(self):
+        reconnected = False
+        while True:
+            conn = None
+            try:
+                conn = connections.create_connection(self.using)
+                conn.ensure_connection()
+                pg = conn.connection
+                pg.autocommit = True
+                with pg.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                logger.info("Listening for queue changes on channel %s", self.channel)
+                if reconnected:
+                    # อาจพลาดการแจ้งเตือนระหว่างที่หลุด ให้หน้าจอโหลดข้อมูลใหม่
+                    self._publish('')
+                reconnected = True
+
+                while True:
+                    if select.select([pg], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                        # ไม่มีการแจ้งเตือน: ตรวจว่า Connection ยังใช้ได้ (การแจ้งเตือนที่มาระหว่างนี้จะอยู่ใน notifies)
+                        with pg.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                    else:
+                        pg.poll()
+                    if pg.notifies:
+                        # รวบการแจ้งเตือนที่มาพร้อมกันเป็นครั้งเดียว
+                        version = pg.notifies[-1].payload
+                        pg.notifies.clear()
+                        self._publish(version)
+            except Exception as e:
+                logger.warning("Queue change listener error, reconnecting in %ss: %s", RECONNECT_DELAY_SECONDS, e)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(RECONNECT_DELAY_SECONDS)
+
+
+listener = QueueChangeListener()
+
+# จำกัดจำนวน Stream ต่อ Process (แต่ละ Stream ใช้ 1 Thread ของ Web server ตลอดการเชื่อมต่อ)
+_stream_slots = threading.BoundedSemaphore(settings.SSE_MAX_CLIENTS)
+
+
+def queue_event_stream():
+    """
+    Generator ของข้อความ SSE สำหรับ 1 หน้าจอ
+    - event: queue  -> ข้อมูลคิวเปลี่ยน (data = เวอร์ชันของคิว) หน้าจอโหลดข้อมูลใหม่
+    - comment ": keepalive" ทุก SSE_HEARTBEAT_SECONDS กัน Proxy ตัด Connection ที่เงียบ
+    - event: bye -> ครบ SSE_STREAM_SECONDS แล้ว Server ปิด Stream (Browser เชื่อมต่อใหม่เองตาม retry)
+    - event: unavailable -> Process นี้มี Stream เต็มแล้ว หน้าจอกลับไปใช้การ Refresh ตามรอบแทน
+    """
+    if not _stream_slots.acquire(blocking=False):
+        yield 'event: unavailable\ndata: \n\n'
+        return
+    try:
+        listener.ensure_started()
+        sequence = listener.sequence
+        deadline = time.monotonic() + settings.SSE_STREAM_SECONDS
+        # เวลารอก่อนเชื่อมต่อใหม่ (ms) เมื่อ Stream ถูกปิด
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            new_sequence, version = listener.wait(sequence, timeout=settings.SSE_HEARTBEAT_SECONDS)
+            if new_sequence != sequence:
+                sequence = new_sequence
+                yield f'event: queue\ndata: {version}\n\n'
+            else:
+                yield ': keepalive\n\n'
+        yield 'event: bye\ndata: \n\n'
+    finally:
+        _stream_slots.release()
@@ -0,0 +1,132 @@
+"""
+เลือก Process เดียวให้เป็นผู้รัน Scheduler (Leader election) ด้วย PostgreSQL Advisory Lock
+ใช้เมื่อรันเว็บหลาย Worker (gunicorn/uvicorn) หรือหลาย Container: ทุก Process เปิด Scheduler ได้
+แต่มีเพียง Process ที่ถือ Lock อยู่เท่านั้นที่ทำงานจริง (Sync จาก MSSQL, เปิด-ปิดกะ)
+- Lock เป็นแบบ Session (pg_try_advisory_lock) ผูกกับ Connection เฉพาะของ Leader (ไม่ใช้ Connection ของ Request)
+- ถ้า Process ของ Leader ตาย Connection หลุด PostgreSQL จะปล่อย Lock ให้ทันที
+  Process อื่นจะได้เป็น Leader แทนในรอบถัดไปของ Job (Failover ภายใน 1 รอบ)
+- Leader ตรวจว่า Connection ยังใช้ได้ทุกครั้งก่อนทำงาน ถ้าหลุดจะสละตำแหน่งแล้วลองแย่งใหม่
+- Process ที่ไม่ใช่ Leader เปิด Connection ค้างไว้ใช้ลองแย่ง Lock ในรอบถัดไป (ไม่เปิด-ปิดใหม่ทุกรอบของ Job)
+  เปิดใหม่เฉพาะเมื่อ Connection เดิมใช้งานไม่ได้
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    def __init__(self, lock_key, using='default'):
+        self.lock_key = lock_key
+        self.using = using
+        self._connection = None  # Connection เฉพาะของ Elector (ทั้งตอนเป็น Leader และตอนรอแย่ง Lock)
+        self._held = False
+        self._lock = threading.Lock()
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def is_leader(self):
+        return self._held
+
+    def ensure_leadership(self):
+        """
+        คืนค่า True ถ้า Process นี้เป็น Leader (ถืออยู่แล้วและ Connection ยังใช้ได้ หรือเพิ่งแย่ง Lock ได้)
+        ไม่รอ Lock (ไม่ Block) ถ้ามี Process อื่นถืออยู่จะคืนค่า False ทันที
+        """
+        with self._lock:
+            if self._held:
+                if self._is_alive():
+                    return True
+                logger.warning("Scheduler leader %s lost its lock connection, stepping down.", self.identity)
+                self._drop()
+            return self._try_acquire()
+
+    def release(self):
+        """ ปล่อย Lock (ถ้าถืออยู่) และปิด Connection ของ Elector ใช้ตอนปิด Scheduler """
+        with self._lock:
+            if self._connection is None:
+                return
+            held = self._held
+            if held:
+                try:
+                    with self._connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", [self.lock_key])
+                except Exception:
+                    pass
+            self._drop()
+            if held:
+                logger.info("Scheduler leader %s released the lock.", self.identity)
+
+    def _try_acquire(self):
+        if self._connection is None:
+            conn = connections.create_connection(self.using)
+            # Job ของ APScheduler รันคนละ Thread กัน ต้องอนุญาตให้ใช้ Connection นี้ข้าม Thread ได้
+            conn.inc_thread_sharing()
+            self._connection = conn
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.lock_key])
+                acquired = cursor.fetchone()[0]
+        except Exception as e:
+            # Connection อาจหลุด: ปิดทิ้ง รอบหน้าค่อยเปิดใหม่
+            logger.warning("Scheduler leader election failed: %s", e)
+            self._drop()
+            return False
+
+        if not acquired:
+            # มี Process อื่นเป็น Leader อยู่: เก็บ Connection ไว้ลองใหม่รอบหน้า
+            return False
+
+        self._held = True
+        logger.info("Scheduler leader elected: %s", self.identity)
+        print(f"Scheduler leader elected: {self.identity}")
+        return True
+
+    def _is_alive(self):
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _drop(self):
+        conn, self._connection = self._connection, None
+        self._held = False
+        if conn is not None:
+            self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        conn.dec_thread_sharing()
+
+
+elector = LeaderElector(settings.SCHEDULER_LEADER_LOCK_KEY)
+
+
+def leader_only(func):
+    """
+    Decorator สำหรับ Job ของ Scheduler: รันเฉพาะเมื่อ Process นี้เป็น Leader ไม่งั้นข้ามไปเงียบๆ
+    Job ไม่ได้รันผ่าน Request จึงไม่มี request_started/request_finished มาปิด Connection ให้
+    ต้องเรียก close_old_connections() เองทั้งก่อนและหลังรัน (ทิ้ง Connection ที่หลุดหรือเกิน CONN_MAX_AGE)
+    ไม่เช่นนั้น run_scheduler ที่รันยาวจะใช้ Connection เดิมที่ถูกตัดไปแล้ว และ Job จะล้มทุกรอบ
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not elector.ensure_leadership():
+            return None
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
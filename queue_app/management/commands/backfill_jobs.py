@@ -0,0 +1,220 @@
+import io
+import time
+from datetime import date, datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from queue_app import queue_log
+from queue_app.bms_sources import get_bms_source
+from queue_app.dashboard_cache import bump_queue_version
+from queue_app.models import JobsBms, QueueEvent, QueueItem, QueueStatus, SyncState
+from queue_app.utils import JOB_SELECT_SQL, JOB_SYNC_FIELDS, TECH_DEPT_SQL, job_from_row
+
+# ชื่อ record ใน SyncState ที่ใช้เก็บ Checkpoint ของการ Backfill (watermark = ปลายช่วงล่าสุดที่ Merge สำเร็จ)
+BACKFILL_STATE_NAME = 'bms_backfill'
+# นำเข้าเฉพาะใบงานที่ปิดแล้ว (2=ซ่อมเสร็จ, 12=ตรวจรับงาน) ใบงานที่ยังเปิดอยู่ให้ Sync ปกติดึงมาสร้างคิวตามลำดับ
+BACKFILL_JOB_STATUSES = ('2', '12')
+# เลขคิวของใบงานย้อนหลัง: ใช้ jobno ต่อท้าย ไม่ใช้ตัวนับเลขคิว (ไม่ให้เลขคิวปัจจุบันกระโดด)
+HISTORICAL_QUEUE_PREFIX = 'BMS-'
+STAGE_TABLE = 'jobs_bms_backfill'
+STAGE_COLUMNS = ['jobno'] + JOB_SYNC_FIELDS + ['row_hash']
+# อักขระที่ต้อง Escape ในรูปแบบข้อความของ COPY
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+SOURCE_SQL = JOB_SELECT_SQL + f"""
+        WHERE jobs.job_status IN ({', '.join(f"'{status}'" for status in BACKFILL_JOB_STATUSES)})
+            AND jobs.dept_control = '2'
+            AND {TECH_DEPT_SQL}
+            AND jobs.req_date >= ?
+            AND jobs.req_date < ?
+"""
+
+# Merge จาก Staging เข้า jobs_bms ใน Statement เดียว เขียนเฉพาะแถวใหม่หรือแถวที่ row_hash เปลี่ยน
+# xmax = 0 แปลว่าเป็นแถวที่ Insert ใหม่ (ไม่ใช่ Update) ใช้นับผลลัพธ์
+MERGE_SQL = """
+    INSERT INTO {jobs_table} ({columns})
+    SELECT DISTINCT ON (jobno) {columns} FROM {stage_table} ORDER BY jobno
+    ON CONFLICT (jobno) DO UPDATE SET {updates}
+    WHERE {jobs_table}.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+    RETURNING (xmax = 0)
+"""
+
+# สร้าง QueueItem สถานะ DONE ให้ใบงานย้อนหลังทั้งหมดในช่วงนี้ (ไม่ให้ sync_to_queue_items สร้างเป็นคิว Waiting)
+# พร้อมบันทึก Event 'created' ของทุกแถวที่ Insert จริงใน Statement เดียวกัน (แบบเดียวกับ QUEUE_ITEMS_FROM_JOBS_SQL)
+# Client ของ /api/changes/ จึงได้รับคิวย้อนหลังด้วย ไม่ต้องโหลดใหม่ทั้งหมด
+HISTORICAL_QUEUE_ITEMS_SQL = """
+    WITH created AS (
+        INSERT INTO {queue_table} (
+            queue_number, user_name, user_department, issue_description, created_at,
+            status_id, linked_job_no, is_urgent, is_adhoc
+        )
+        SELECT
+            %(prefix)s || j.jobno,
+            COALESCE(NULLIF(j.caller, ''), 'Unknown'),
+            COALESCE(NULLIF(j.descriptions, ''), 'Unknown'),
+            COALESCE(j.description, ''),
+            j.req_date,
+            %(done)s, j.jobno, 0, 0
+        FROM {jobs_table} j
+        WHERE j.jobno IN (SELECT jobno FROM {stage_table})
+        ORDER BY j.req_date, j.jobno
+        ON CONFLICT DO NOTHING
+        RETURNING id, queue_number, linked_job_no, user_name, user_department, created_at
+    ), logged AS (
+        INSERT INTO {event_table} (queue_item_id, queue_number, event_type, new_value, data, actor, created_at)
+        SELECT id, queue_number, %(event_type)s, %(done_code)s,
+            jsonb_build_object('linked_job_no', linked_job_no, 'user_name', user_name,
+                               'user_department', user_department, 'created_at', created_at),
+            %(actor)s, %(now)s
+        FROM created ORDER BY id
+    )
+    SELECT count(*) FROM created
+"""
+
+
+class Command(BaseCommand):
+    help = ('Backfill closed BMS jobs into jobs_bms by req_date range: each chunk is streamed from the source, '
+            'COPY-ed into a staging table and merged in one statement, then checkpointed so the import can resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First req_date to import, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='Import req_date before this date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--resume', action='store_true', help='Continue from the last completed chunk')
+        parser.add_argument('--days-per-chunk', type=int, default=30, help='req_date range per chunk/transaction (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per fetch and per COPY (default: 5000)')
+        parser.add_argument('--no-queue-items', action='store_false', dest='queue_items',
+                            help='Do not create DONE queue items for the imported jobs')
+
+    def handle(self, *args, **options):
+        state, _ = SyncState.objects.get_or_create(name=BACKFILL_STATE_NAME)
+        end = datetime.combine(options['end'] or date.today(), datetime.min.time())
+        if options['resume'] and state.watermark:
+            start = state.watermark
+            self.stdout.write(f"Resuming backfill from checkpoint {start:%Y-%m-%d %H:%M:%S}")
+        elif options['start']:
+            start = datetime.combine(options['start'], datetime.min.time())
+        else:
+            raise CommandError('Give --start (or --resume after a previous run).')
+        if start >= end:
+            self.stdout.write(self.style.SUCCESS('Nothing to backfill.'))
+            return
+
+        done_status = None
+        if options['queue_items']:
+            done_status = QueueStatus.objects.filter(code='DONE').first()
+            if done_status is None:
+                raise CommandError("QueueStatus 'DONE' not found (run populate_statuses first) or use --no-queue-items.")
+
+        source = get_bms_source()
+        step = timedelta(days=options['days_per_chunk'])
+        totals = {'fetched': 0, 'inserted': 0, 'updated': 0, 'queue_items': 0}
+        started = time.perf_counter()
+        try:
+            with source.connection() as conn:
+                cursor = conn.cursor()
+                chunk_start = start
+                while chunk_start < end:
+                    chunk_end = min(chunk_start + step, end)
+                    chunk_started = time.perf_counter()
+                    stats = self.backfill_chunk(cursor, chunk_start, chunk_end, options['batch_size'], done_status, state)
+                    for key, value in stats.items():
+                        totals[key] += value
+                    self.stdout.write(
+                        f"{chunk_start:%Y-%m-%d} .. {chunk_end:%Y-%m-%d}: fetched {stats['fetched']}, "
+                        f"inserted {stats['inserted']}, updated {stats['updated']}, "
+                        f"queue items {stats['queue_items']} ({time.perf_counter() - chunk_started:.1f}s)"
+                    )
+                    chunk_start = chunk_end
+        finally:
+            source.close()
+            if totals['queue_items']:
+                bump_queue_version()
+
+        elapsed = time.perf_counter() - started
+        rate = totals['fetched'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {totals['fetched']} jobs in {elapsed:.1f}s ({rate:.0f} jobs/s): "
+            f"{totals['inserted']} inserted, {totals['updated']} updated, {totals['queue_items']} queue items created."
+        ))
+
+    def backfill_chunk(self, source_cursor, chunk_start, chunk_end, batch_size, done_status, state):
+        """
+        นำเข้าใบงานที่ req_date อยู่ในช่วง [chunk_start, chunk_end) ใน Transaction เดียว
+        COPY เข้าตาราง Staging ชั่วคราวทีละ batch_size แถว -> Merge -> สร้าง QueueItem (พร้อม Event) -> บันทึก Checkpoint
+        ถ้าล้มเหลวกลางทาง ทั้งช่วงจะ Rollback และ --resume จะเริ่มที่ช่วงนี้ใหม่
+        """
+        stats = {'fetched': 0, 'inserted': 0, 'updated': 0, 'queue_items': 0}
+        columns = ', '.join(STAGE_COLUMNS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE {STAGE_TABLE} ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {JobsBms._meta.db_table} WITH NO DATA"
+            )
+
+            source_cursor.execute(SOURCE_SQL, [chunk_start, chunk_end])
+            index = {column[0]: i for i, column in enumerate(source_cursor.description)}
+            copy_sql = f"COPY {STAGE_TABLE} ({columns}) FROM STDIN"
+            while True:
+                rows = source_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                # คำนวณวันที่/การจัดประเภท/row_hash แบบเดียวกับ Sync ปกติ แล้วเขียนเป็นข้อความของ COPY ใน Memory
+                buffer = io.StringIO()
+                write_copy_rows(buffer, (job_from_row(row, index) for row in rows))
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+                stats['fetched'] += len(rows)
+
+            if not stats['fetched']:
+                self.save_checkpoint(state, chunk_end)
+                return stats
+
+            cursor.execute(f"ANALYZE {STAGE_TABLE}")
+            if done_status is not None:
+                # ถือ Lock ของ Event log ก่อนเขียน jobs_bms/QueueItem (ลำดับเดียวกับ Sync ดู queue_log.py)
+                # เอาหลังการ COPY ลง Staging ที่อาจใช้เวลานาน เพื่อไม่ให้ขวางการเขียนคิวจากหน้าจอระหว่างดึงข้อมูล
+                queue_log.lock_event_log()
+            cursor.execute(MERGE_SQL.format(
+                jobs_table=JobsBms._meta.db_table,
+                stage_table=STAGE_TABLE,
+                columns=columns,
+                updates=', '.join(f'{field} = EXCLUDED.{field}' for field in STAGE_COLUMNS[1:]),
+            ))
+            for (inserted,) in cursor.fetchall():
+                stats['inserted' if inserted else 'updated'] += 1
+
+            if done_status is not None:
+                cursor.execute(HISTORICAL_QUEUE_ITEMS_SQL.format(
+                    queue_table=QueueItem._meta.db_table,
+                    jobs_table=JobsBms._meta.db_table,
+                    stage_table=STAGE_TABLE,
+                    event_table=QueueEvent._meta.db_table,
+                ), {
+                    'prefix': HISTORICAL_QUEUE_PREFIX,
+                    'done': done_status.id,
+                    'done_code': done_status.code,
+                    'event_type': QueueEvent.EVENT_CREATED,
+                    'actor': queue_log.ACTOR_BACKFILL,
+                    'now': datetime.now().replace(microsecond=0),
+                })
+                stats['queue_items'] = cursor.fetchone()[0]
+
+            self.save_checkpoint(state, chunk_end)
+        return stats
+
+    def save_checkpoint(self, state, chunk_end):
+        state.watermark = chunk_end
+        state.save(update_fields=['watermark', 'updated_at'])
+
+
+def copy_value(value):
+    """ แปลงค่าเป็นข้อความของ COPY (FORMAT text): None = \\N และ Escape อักขระพิเศษ """
+    if value is None:
+        return '\\N'
+    return str(value).translate(COPY_ESCAPES)
+
+
+def write_copy_rows(buffer, jobs):
+    """ เขียน JobsBms ลง buffer ทีละบรรทัด (คั่นด้วย Tab) สำหรับ COPY ... FROM STDIN """
+    for job in jobs:
+        buffer.write('\t'.join(copy_value(getattr(job, field)) for field in STAGE_COLUMNS))
+        buffer.write('\n')
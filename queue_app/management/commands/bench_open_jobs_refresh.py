@@ -0,0 +1,78 @@
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from queue_app.bms_sources import STAND_IN_SCHEMA, SqliteSource
+from queue_app.utils import JOB_SELECT_SQL, jobs_by_ids_sql
+
+class Command(BaseCommand):
+    help = 'Benchmark chunked IN (...) vs set-based JSON refresh of open jobs against a local SQLite stand-in for BMS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=20000, help='Rows in the stand-in jobs table (default: 20000)')
+        parser.add_argument('--open', type=int, default=2000, help='Number of open job IDs to refresh (default: 2000)')
+        parser.add_argument('--chunk-size', type=int, default=50, help='IDs per query for the chunked approach (default: 50)')
+        parser.add_argument('--latency-ms', type=float, default=0.0,
+                            help='Simulated network round-trip per query in ms, e.g. 20 for the WAN link to BMS (default: 0)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per approach, best time is reported (default: 5)')
+
+    def handle(self, *args, **options):
+        conn = self._build_stand_in(options['jobs'])
+        job_ids = random.sample(range(1, options['jobs'] + 1), min(options['open'], options['jobs']))
+        latency = options['latency_ms'] / 1000.0
+
+        results = {}
+        for name, func in (('chunked', self._refresh_chunked), ('set_based', self._refresh_set_based)):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                row_count, round_trips = func(conn, job_ids, options['chunk_size'], latency)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = best
+            self.stdout.write(f"{name:<10} rows={row_count:<6} round_trips={round_trips:<4} best={best * 1000:.1f} ms")
+
+        speedup = results['chunked'] / results['set_based'] if results['set_based'] else 0
+        self.stdout.write(self.style.SUCCESS(f'Set-based refresh is {speedup:.1f}x faster than chunked.'))
+
+    def _refresh_chunked(self, conn, job_ids, chunk_size, latency):
+        """ วิธีเดิม: แบ่ง ID ทีละ chunk_size แล้วต่อ String IN (...) ทีละ Query """
+        cursor = conn.cursor()
+        rows = 0
+        round_trips = 0
+        for i in range(0, len(job_ids), chunk_size):
+            ids_placeholder = ', '.join(map(str, job_ids[i:i + chunk_size]))
+            cursor.execute(JOB_SELECT_SQL + f" WHERE jobs.jobno IN ({ids_placeholder})")
+            time.sleep(latency)
+            rows += len(cursor.fetchall())
+            round_trips += 1
+        return rows, round_trips
+
+    def _refresh_set_based(self, conn, job_ids, chunk_size, latency):
+        """ วิธีใหม่: ส่ง ID ทั้งหมดเป็น JSON ใน Parameter เดียว (SQLite ใช้ json_each แทน OPENJSON) """
+        cursor = conn.cursor()
+        cursor.execute(jobs_by_ids_sql(ids_subquery=SqliteSource.ids_subquery), [json.dumps(job_ids)])
+        time.sleep(latency)
+        return len(cursor.fetchall()), 1
+
+    def _build_stand_in(self, job_count):
+        """ สร้างตาราง jobs / employee / m_dept จำลองใน Memory (เฉพาะคอลัมน์ที่ Sync ใช้) """
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(STAND_IN_SCHEMA)
+        conn.executemany("INSERT INTO employee VALUES (?, ?)", [(i, f'ช่าง {i}') for i in range(1, 21)])
+        conn.executemany("INSERT INTO m_dept VALUES (?, ?, ?)", [(f'D{i}', f'DEP{i}', f'แผนก {i}') for i in range(1, 51)])
+
+        base = datetime(2025, 1, 1, 8, 0)
+        rows = []
+        for jobno in range(1, job_count + 1):
+            req_date = (base + timedelta(minutes=jobno)).isoformat(' ')
+            rows.append((
+                jobno, 'HW', 'คอมพิวเตอร์ เปิดไม่ติด', 'T1', jobno % 20 + 1, f'D{jobno % 50 + 1}', req_date,
+                None, None, req_date, f'ผู้แจ้ง {jobno}', None, None, None, None, None, '1', None, req_date,
+                'admin', None, '2',
+            ))
+        conn.executemany("INSERT INTO jobs VALUES (" + ', '.join(['?'] * 22) + ")", rows)
+        conn.commit()
+        return conn
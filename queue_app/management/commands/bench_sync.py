@@ -0,0 +1,254 @@
+import io
+import json
+import os
+import random
+import re
+import resource
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models.signals import pre_migrate
+from django.test.utils import override_settings
+from queue_app.bms_sources import JOBS_COLUMNS, STAND_IN_SCHEMA, SqliteSource
+from queue_app.models import SyncRun
+from queue_app.utils import sync_jobs_from_mssql
+
+# รายละเอียดอาการเสียตัวอย่าง (ครอบคลุมทุกระดับความยาก/ประเภทงานใน classification.py)
+DESCRIPTIONS = [
+    'คอมพิวเตอร์ เปิดไม่ติด', 'ปรินเตอร์ กระดาษติด', 'พิมพ์ ไม่ได้ ขึ้น offline', 'อินเทอร์เน็ต หลุด บ่อย',
+    'อินเทอร์เน็ต ช้า มาก', 'เมาส์ เสีย', 'คีย์บอร์ด กดไม่ติด', 'ขอเปลี่ยนรหัส ผ่าน HIS', 'ตั้งค่า อีเมล',
+    'ลงโปรแกรม excel ใหม่', 'windows update ค้าง', 'จอ ภาพไม่ขึ้น', 'ย้ายโทรศัพท์ ไปห้องใหม่', 'เพิ่มสายแลน 2 จุด',
+    'ไวรัส ขึ้นหน้าจอ', 'กู้ข้อมูล ไฟล์หาย', 'server ห้องยา ล่ม', 'database ช้า', 'ระบบล่ม ทั้งแผนก',
+    'คอมพิวเตอร์(ชำรุด) ส่งซ่อม', 'เปลี่ยนอะไหล่ พาวเวอร์ซัพพลาย', 'ไฟดับ UPS ร้อง', 'สแกนเนอร์ ไม่ทำงาน',
+]
+CALLERS = ['สมชาย', 'สมหญิง', 'วิไล', 'ประเสริฐ', 'กมล', 'นภา', 'ธนา', 'อรุณ', 'สุดา', 'พรทิพย์']
+DEPARTMENTS = [
+    ('OPD', 'ผู้ป่วยนอก'), ('IPD', 'ผู้ป่วยใน'), ('ER', 'ฉุกเฉิน'), ('LAB', 'ห้องปฏิบัติการ'), ('XR', 'รังสีวิทยา'),
+    ('PH', 'ห้องยา'), ('FIN', 'การเงิน'), ('HR', 'บุคคล'), ('ICU', 'ผู้ป่วยหนัก'), ('OR', 'ห้องผ่าตัด'),
+]
+TECHNICIANS = ['ช่างเอ', 'ช่างบี', 'ช่างซี', 'ช่างดี', 'ช่างอี', 'ช่างเอฟ']
+OPEN_STATUSES = ['1', '11']
+CLOSED_STATUSES = ['2', '12']
+# Cache แยกของ Benchmark: bump_queue_version() ระหว่าง Sync ต้องไม่ไปเลื่อนเวอร์ชันคิวใน Cache ที่ใช้ร่วมกับระบบจริง (Redis)
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-sync'}}
+
+
+def create_search_path_schemas(sender, using='default', **kwargs):
+    """ ฐานข้อมูลที่สร้างใหม่ยังไม่มี Schema ตาม search_path ใน OPTIONS (เช่น intra_tl) สร้างก่อน Migrate """
+    options = connections[using].settings_dict.get('OPTIONS', {}).get('options', '')
+    match = re.search(r'search_path=([\w,]+)', options)
+    if not match:
+        return
+    with connections[using].cursor() as cursor:
+        for schema in match.group(1).split(','):
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+
+class CountingSqliteSource(SqliteSource):
+    """ SqliteSource ที่นับจำนวน Query ที่ส่งไปยัง Source (แทนจำนวน Round trip ไป BMS) """
+    def __init__(self, path):
+        super().__init__(path)
+        self.queries = 0
+
+    def connect(self):
+        conn = super().connect()
+        conn.set_trace_callback(self._count)
+        return conn
+
+    def _count(self, statement):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.queries += 1
+
+
+class Command(BaseCommand):
+    help = ('Benchmark sync_jobs_from_mssql end to end against a generated SQLite stand-in for BMS. '
+            'Runs in a throwaway test database (test_<NAME>, needs CREATEDB) that is dropped afterwards; '
+            'the live database and cache are never touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=10000, help='Jobs in the synthetic BMS dataset, e.g. 1000 / 10000 / 100000 (default: 10000)')
+        parser.add_argument('--open-ratio', type=float, default=0.1, help='Fraction of jobs still open (default: 0.1)')
+        parser.add_argument('--churn', type=float, default=0.01, help='Fraction of jobs modified before each incremental run (default: 0.01)')
+        parser.add_argument('--runs', type=int, default=3, help='Incremental runs after the initial full sync (default: 3)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generator (default: 42)')
+        parser.add_argument('--output', default='bench_sync.json', help='Where to write the JSON report (default: bench_sync.json)')
+        parser.add_argument('--keep-source', action='store_true', help='Keep the generated SQLite file and print its path')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Drop a leftover test database without asking')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        fd, path = tempfile.mkstemp(prefix='bms_bench_', suffix='.sqlite3')
+        os.close(fd)
+        live_db_name = connection.settings_dict['NAME']
+        try:
+            started = time.perf_counter()
+            generate_bms_dataset(path, options['jobs'], options['open_ratio'], rng)
+            self.stdout.write(f"Generated {options['jobs']} jobs in {time.perf_counter() - started:.1f}s ({path})")
+
+            # สร้างฐานข้อมูลทดสอบแยก (test_<NAME>) แล้ว Migrate: ไม่แตะข้อมูลหรือ Lock ของฐานข้อมูลจริงที่ Scheduler/หน้าจอใช้อยู่
+            pre_migrate.connect(create_search_path_schemas, dispatch_uid='bench_sync_schemas')
+            try:
+                db_name = connection.creation.create_test_db(
+                    verbosity=0, autoclobber=not options['interactive'], serialize=False,
+                )
+            finally:
+                pre_migrate.disconnect(dispatch_uid='bench_sync_schemas')
+            self.stdout.write(f"Created benchmark database '{db_name}'")
+
+            try:
+                with override_settings(CACHES=BENCH_CACHES):
+                    call_command('populate_statuses', stdout=io.StringIO())
+                    source = CountingSqliteSource(path)
+                    runs = [self._run(source, full=True, label='full')]
+                    for i in range(options['runs']):
+                        touched = churn_bms_dataset(path, options['churn'], rng)
+                        run = self._run(source, full=False, label=f'incremental_{i + 1}')
+                        run['source_rows_touched'] = touched
+                        runs.append(run)
+            finally:
+                connection.creation.destroy_test_db(live_db_name, verbosity=0)
+        finally:
+            if options['keep_source']:
+                self.stdout.write(f"Kept stand-in source: {path}")
+            else:
+                os.remove(path)
+
+        report = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'database': db_name,
+            'jobs': options['jobs'],
+            'open_ratio': options['open_ratio'],
+            'churn': options['churn'],
+            'seed': options['seed'],
+            # ru_maxrss เป็น KB บน Linux
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'runs': runs,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        for run in runs:
+            self.stdout.write(
+                f"{run['label']:<14} {run['seconds']:>7.2f}s  {run['rows_per_second']:>9.0f} rows/s  "
+                f"fetched={run['rows_fetched']:<7} changed={run['rows_changed']:<7} "
+                f"db_queries={run['db_queries']:<5} source_queries={run['source_queries']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Peak RSS {report['peak_rss_mb']} MB. Report written to {options['output']}"))
+
+    def _run(self, source, full, label):
+        """ รัน Sync 1 รอบ นับ Query ฝั่ง PostgreSQL (execute_wrapper) และฝั่ง Source แล้วอ่านเวลาแต่ละขั้นตอนจาก SyncRun """
+        db_queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal db_queries
+            db_queries += 1
+            return execute(sql, params, many, context)
+
+        source.queries = 0
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            sync_jobs_from_mssql(full=full, source=source)
+            seconds = time.perf_counter() - started
+
+        sync_run = SyncRun.objects.order_by('-id').first()
+        fetched = sync_run.rows_fetched if sync_run else 0
+        return {
+            'label': label,
+            'seconds': round(seconds, 3),
+            'rows_fetched': fetched,
+            'rows_changed': sync_run.rows_changed if sync_run else 0,
+            'queue_items_created': sync_run.queue_items_created if sync_run else 0,
+            'statuses_updated': sync_run.statuses_updated if sync_run else 0,
+            'rows_per_second': round(fetched / seconds, 1) if seconds else 0,
+            'db_queries': db_queries,
+            'source_queries': source.queries,
+            'stage_timings': sync_run.stage_timings if sync_run else {},
+            'success': sync_run.success if sync_run else False,
+        }
+
+
+def generate_bms_dataset(path, job_count, open_ratio, rng):
+    """ สร้างไฟล์ SQLite ที่มีตาราง jobs / employee / m_dept จำลองของ BMS ขนาด job_count ใบงาน """
+    conn = sqlite3.connect(path)
+    conn.executescript(STAND_IN_SCHEMA)
+    conn.executemany("INSERT INTO employee VALUES (?, ?)", list(enumerate(TECHNICIANS, start=1)))
+    conn.executemany("INSERT INTO m_dept VALUES (?, ?, ?)", [(abb, abb, name) for abb, name in DEPARTMENTS])
+
+    now = datetime.now().replace(microsecond=0)
+    # ใบงานกระจายย้อนหลัง ~2 ปี ใบงานที่ยังเปิดอยู่เป็นใบงานล่าสุด
+    span_minutes = 2 * 365 * 24 * 60
+    open_from = job_count - int(job_count * open_ratio)
+    batch = []
+    for jobno in range(1, job_count + 1):
+        req_date = now - timedelta(minutes=span_minutes * (job_count - jobno) // job_count + 5)
+        is_open = jobno > open_from
+        assigned = req_date + timedelta(minutes=rng.randint(5, 120))
+        row = {
+            'jobno': jobno,
+            'catagory': rng.choice(['HW', 'SW', 'NW']),
+            'description': rng.choice(DESCRIPTIONS),
+            # ส่วนใหญ่เป็นแผนกช่าง IT (T*) มีบางส่วนเป็นแผนกอื่น
+            'dept_tech': rng.choice(['T1', 'T1', 'T2', 'T3', 'T3', 'M1']),
+            'emp_id': rng.randint(1, len(TECHNICIANS)),
+            'dept': rng.choice(DEPARTMENTS)[0],
+            'jobdate': req_date,
+            'assign_date': None if is_open and rng.random() < 0.5 else min(assigned, now),
+            'req_date': req_date,
+            'caller': rng.choice(CALLERS),
+            'note': rng.choice([None, 'รออะไหล่', 'ติดต่อกลับ']),
+            'job_status': rng.choice(OPEN_STATUSES if is_open else CLOSED_STATUSES),
+            'enterdate': req_date,
+            'enterby': 'bench',
+            'outsource_date': req_date.replace(second=0) if is_open and rng.random() < 0.05 else None,
+            'dept_control': '2',
+        }
+        batch.append([row.get(column) for column in JOBS_COLUMNS])
+        if len(batch) >= 10000:
+            _insert_jobs(conn, batch)
+            batch = []
+    _insert_jobs(conn, batch)
+    conn.commit()
+    conn.close()
+
+
+def churn_bms_dataset(path, churn, rng):
+    """
+    จำลองการเปลี่ยนแปลงระหว่างรอบ Sync: แก้ไขใบงานที่ยังเปิดอยู่บางส่วน (สถานะ/หมายเหตุ/วันที่เริ่มงาน)
+    ปิดงานบางส่วน และเพิ่มใบงานใหม่ คืนค่าจำนวนแถวที่ถูกแก้ไข/เพิ่ม
+    """
+    conn = sqlite3.connect(path)
+    now = datetime.now().replace(microsecond=0)
+    job_count = conn.execute("SELECT MAX(jobno) FROM jobs").fetchone()[0]
+    open_ids = [row[0] for row in conn.execute("SELECT jobno FROM jobs WHERE job_status IN ('1', '11')")]
+    touched = max(1, int(job_count * churn))
+
+    changed = rng.sample(open_ids, min(len(open_ids), touched // 2))
+    for jobno in changed:
+        if rng.random() < 0.3:
+            conn.execute("UPDATE jobs SET job_status = ?, act_dfin = ? WHERE jobno = ?", (rng.choice(CLOSED_STATUSES), now, jobno))
+        else:
+            conn.execute("UPDATE jobs SET note = ?, act_dstart = ? WHERE jobno = ?", (f'อัปเดต {now:%H:%M:%S}', now, jobno))
+
+    new_rows = []
+    for jobno in range(job_count + 1, job_count + 1 + (touched - len(changed))):
+        values = {
+            'jobno': jobno, 'catagory': 'HW', 'description': rng.choice(DESCRIPTIONS), 'dept_tech': 'T1',
+            'emp_id': rng.randint(1, len(TECHNICIANS)), 'dept': rng.choice(DEPARTMENTS)[0], 'jobdate': now,
+            'req_date': now, 'caller': rng.choice(CALLERS), 'job_status': '1', 'enterdate': now,
+            'enterby': 'bench', 'dept_control': '2',
+        }
+        new_rows.append([values.get(column) for column in JOBS_COLUMNS])
+    _insert_jobs(conn, new_rows)
+    conn.commit()
+    conn.close()
+    return len(changed) + len(new_rows)
+
+
+def _insert_jobs(conn, rows):
+    if rows:
+        conn.executemany(f"INSERT INTO jobs VALUES ({', '.join(['?'] * len(JOBS_COLUMNS))})", rows)
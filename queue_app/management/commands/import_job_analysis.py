@@ -7,7 +7,9 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         self.stdout.write("Starting sync job...")
         try:
-            count = sync_jobs_from_mssql()
-            self.stdout.write(self.style.SUCCESS(f'Successfully synced {count} jobs.'))
+            totals = sync_jobs_from_mssql()
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully synced {totals['fetched']} jobs ({totals['changed']} changed, {totals['created']} new queue items)."
+            ))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error syncing jobs: {e}'))
@@ -9,12 +9,8 @@ class Command(BaseCommand):
             {'code': 'WAITING', 'name': 'รอรับบริการ', 'color': 'warning', 'id': 1},
             {'code': 'ACTIVE', 'name': 'กำลังดำเนินการ', 'color': 'info', 'id': 2},
             {'code': 'DONE', 'name': 'เสร็จสิ้น', 'color': 'success', 'id': 3},
-            # Using 5 for Coordinating/Spare Parts as inferred from utils.py logic
+            # Using 5 for Coordinating/Spare Parts (รวมสถานะรออะไหล่ ID 6 เดิมไว้ที่นี่แล้ว ดู Migration 0029)
             {'code': 'COORDINATING', 'name': 'รอประสานงาน', 'color': 'primary', 'id': 5}, 
-             # WAITING_PARTS might be deprecated as per utils.py logic (id 6 -> 5), but dashboard still references it in filter.
-             # We will create it if needed or map it. Dashboard uses code 'WAITING_PARTS'.
-             # Let's add it for safety if the code expects it, but maybe as id 6.
-            {'code': 'WAITING_PARTS', 'name': 'รออะไหล่', 'color': 'primary', 'id': 6},
         ]
 
         for s in statuses:
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from queue_app.models import JobsBms
+from queue_app.classification import classify_description
+from queue_app.utils import job_row_hash
+
+class Command(BaseCommand):
+    help = 'Recalculate difficulty / job_category_type of existing JobsBms rows after the rules in classification.py change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk update (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count rows that would change')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        scanned = 0
+        changed = 0
+        pending = []
+
+        self.stdout.write("Reclassifying JobsBms rows...")
+        for job in JobsBms.objects.order_by('id').iterator(chunk_size=batch_size):
+            scanned += 1
+            difficulty, category = classify_description(job.description)
+            if job.difficulty == difficulty and job.job_category_type == category:
+                continue
+
+            job.difficulty = difficulty
+            job.job_category_type = category
+            # row_hash รวมค่าที่คำนวณเองด้วย ต้องคำนวณใหม่ให้ตรงกับข้อมูลที่เก็บ
+            job.row_hash = job_row_hash(job)
+            pending.append(job)
+            changed += 1
+
+            if len(pending) >= batch_size:
+                self._flush(pending, dry_run)
+                pending = []
+
+        self._flush(pending, dry_run)
+
+        verb = 'would change' if dry_run else 'updated'
+        self.stdout.write(self.style.SUCCESS(f'Scanned {scanned} jobs, {verb} {changed}.'))
+
+    def _flush(self, jobs, dry_run):
+        if jobs and not dry_run:
+            JobsBms.objects.bulk_update(jobs, ['difficulty', 'job_category_type', 'row_hash'])
@@ -0,0 +1,64 @@
+import logging
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from apscheduler.schedulers.blocking import BlockingScheduler
+from django.core.management.base import BaseCommand
+from queue_app import metrics, scheduler as queue_scheduler
+from queue_app.leader import elector
+from queue_app.bms_sources import get_bms_source
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Run the APScheduler jobs (MSSQL sync, auto open/close shift) in a dedicated process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help='Serve Prometheus metrics of this process on http://0.0.0.0:PORT/metrics')
+
+    def handle(self, *args, **options):
+        if options['metrics_port']:
+            self._serve_metrics(options['metrics_port'])
+
+        scheduler = BlockingScheduler()
+        queue_scheduler.configure_jobs(scheduler)
+
+        # SIGTERM (docker stop) / SIGINT (Ctrl+C): รอ Job ที่กำลังรันอยู่ให้จบก่อนแล้วค่อยปิด
+        def stop(signum, frame):
+            self.stdout.write(f"Received {signal.Signals(signum).name}, shutting down scheduler...")
+            scheduler.shutdown(wait=True)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(self.style.SUCCESS("Scheduler started. Press Ctrl+C to stop."))
+        queue_scheduler.log_started_jobs()
+        try:
+            scheduler.start()
+        finally:
+            # ปล่อย Leader lock และปิด Connection ไป BMS ที่ค้างอยู่ใน Pool
+            elector.release()
+            get_bms_source().close()
+        self.stdout.write(self.style.SUCCESS("Scheduler stopped."))
+
+    def _serve_metrics(self, port):
+        """ เปิด HTTP Server เล็กๆ ใน Thread แยก ให้ Prometheus ดึงสถิติการ Sync ของ Process นี้ได้ """
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.REGISTRY.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', metrics.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        self.stdout.write(f"Serving metrics on http://0.0.0.0:{port}/metrics")
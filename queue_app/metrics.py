@@ -0,0 +1,211 @@
+"""
+ตัวเก็บค่าสถิติ (Metrics) แบบเบาๆ ในหน่วยความจำ แสดงผลเป็นรูปแบบข้อความของ Prometheus (text exposition format)
+ไม่ต้องติดตั้ง Library เพิ่ม ใช้กับ View /metrics และ run_scheduler --metrics-port
+- Counter: ค่าที่เพิ่มขึ้นอย่างเดียว (เช่น จำนวนแถวที่ Sync, จำนวน Error)
+- Gauge: ค่าล่าสุด ณ ขณะนั้น (เช่น เวลาที่ Sync สำเร็จครั้งล่าสุด)
+- Histogram: การกระจายของเวลา (เช่น เวลาแต่ละขั้นตอนของการ Sync, เวลาตอบสนองของหน้า Dashboard)
+หมายเหตุ: ค่าแยกกันตาม Process (แต่ละ Worker ของ gunicorn / Process ของ run_scheduler มีค่าของตัวเอง)
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ช่วงเวลา (วินาที) ของ Histogram ครอบคลุมตั้งแต่ Query เร็วๆ ถึง Sync ที่ช้ากว่ารอบ 20 วินาที
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ คืนค่าข้อความของทุก Metric ในรูปแบบ Prometheus """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", _format_value(bound)),))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {counts[-1]}')
+        return lines
+
+
+# ---------------------------------------------------------
+# Metrics ของการ Sync จาก BMS (MSSQL)
+# ---------------------------------------------------------
+SYNC_STAGE_SECONDS = Histogram(
+    'bms_sync_stage_seconds', 'Duration of each BMS sync stage in seconds.', ['stage'])
+SYNC_RUNS = Counter(
+    'bms_sync_runs_total', 'BMS sync runs by mode and result.', ['mode', 'result'])
+SYNC_ROWS = Counter(
+    'bms_sync_rows_total', 'Rows processed by BMS sync stages (fetched, changed, skipped, deleted, created, updated).',
+    ['stage', 'kind'])
+SYNC_ERRORS = Counter(
+    'bms_sync_errors_total', 'Errors raised during BMS sync, by stage.', ['stage'])
+SYNC_LAST_SUCCESS = Gauge(
+    'bms_sync_last_success_timestamp_seconds', 'Unix time of the last BMS sync run that finished without errors.')
+# Connection pool ไปยังฐานข้อมูลภายนอก (ดู connection_pool.py) แยกตามชื่อ Pool เช่น pool="mssql"
+POOL_CONNECT_SECONDS = Histogram(
+    'bms_pool_connect_seconds', 'Time to open a new connection in a source connection pool, in seconds.', ['pool'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+POOL_EVENTS = Counter(
+    'bms_pool_events_total', 'Source connection pool events (connects, connect_failures, reuses, ping_failures, discarded).',
+    ['pool', 'event'])
+POOL_IDLE = Gauge(
+    'bms_pool_idle_connections', 'Idle connections currently kept in a source connection pool.', ['pool'])
+
+# ---------------------------------------------------------
+# Metrics ของหน้าเว็บ
+# ---------------------------------------------------------
+REQUEST_SECONDS = Histogram(
+    'queue_request_seconds', 'Latency of queue views in seconds.', ['view'])
+
+
+@contextmanager
+def sync_stage(stage, timings=None):
+    """
+    จับเวลาขั้นตอนหนึ่งของการ Sync ลง Histogram (และลง dict timings ถ้าส่งมา)
+    ถ้าเกิด Exception จะนับ Error ของขั้นตอนนั้นแล้ว raise ต่อ
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SYNC_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        SYNC_STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + elapsed, 4)
+
+
+def record_rows(stage, stats):
+    """ บันทึกจำนวนแถวจาก Counter/dict ของผลการ Sync เช่น {'fetched': 10, 'changed': 2} """
+    for kind, value in stats.items():
+        if value:
+            SYNC_ROWS.inc(value, stage=stage, kind=kind)
+
+
+def record_pool(pool, snapshot):
+    """ บันทึกจำนวน Connection ที่ว่างอยู่ใน Pool (ตัวนับสะสมและเวลาเชื่อมต่อ Pool บันทึกเองตอนเกิดเหตุการณ์) """
+    if 'idle' in snapshot:
+        POOL_IDLE.set(snapshot['idle'], pool=pool)
+
+
+def timed_view(func):
+    """ Decorator ของ View: บันทึกเวลาตอบสนองลง queue_request_seconds{view=ชื่อฟังก์ชัน} """
+    @functools.wraps(func)
+    def wrapper(request, *args, **kwargs):
+        with REQUEST_SECONDS.time(view=func.__name__):
+            return func(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # เดิมชื่อ 0026_members_syncstate (รวม Members ไว้ด้วย) ย้าย Members ไปที่ 0034_members
+    # ฐานข้อมูลที่เคยรันชื่อเดิมแล้วจะถือว่ารันไฟล์นี้แล้ว
+    replaces = [('queue_app', '0026_members_syncstate')]
+
+    dependencies = [
+        ('queue_app', '0025_delete_globalconfig'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0026_syncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobsbms',
+            name='row_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:14
+
+from django.db import migrations, models
+
+
+def seed_counter(apps, schema_editor):
+    """ ตั้งค่าตัวนับเริ่มต้น (ไม่รีเซ็ต) ให้ต่อจากเลขคิว IT-XXXX ที่มากที่สุดที่มีอยู่แล้ว """
+    QueueItem = apps.get_model('queue_app', 'QueueItem')
+    QueueNumberCounter = apps.get_model('queue_app', 'QueueNumberCounter')
+
+    last_value = 0
+    for queue_number in QueueItem.objects.filter(queue_number__regex=r'^IT-[0-9]+$').values_list('queue_number', flat=True).iterator():
+        last_value = max(last_value, int(queue_number[3:]))
+    QueueNumberCounter.objects.update_or_create(period='', defaults={'last_value': last_value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0027_jobsbms_row_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=20, unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
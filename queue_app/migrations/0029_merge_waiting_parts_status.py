@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def merge_waiting_parts_status(apps, schema_editor):
+    """
+    ยกเลิกการใช้สถานะ ID 6 (รออะไหล่) โดยย้ายคิวทั้งหมดไปสถานะ ID 5 (รอประสานงาน) แล้วลบสถานะ 6 ทิ้ง
+    เดิมทำซ้ำทุกรอบ Sync ใน update_queue_status_from_logic() ย้ายมาทำครั้งเดียวที่นี่
+    """
+    QueueItem = apps.get_model('queue_app', 'QueueItem')
+    QueueStatus = apps.get_model('queue_app', 'QueueStatus')
+
+    if not QueueStatus.objects.filter(id=5).exists():
+        return
+    QueueItem.objects.filter(status_id=6).update(status_id=5)
+    QueueStatus.objects.filter(id=6).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0028_queuenumbercounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_waiting_parts_status, migrations.RunPython.noop),
+    ]
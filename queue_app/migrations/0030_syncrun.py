@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0029_merge_waiting_parts_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(db_index=True)),
+                ('mode', models.CharField(max_length=20)),
+                ('success', models.BooleanField(default=False)),
+                ('stage_timings', models.JSONField(blank=True, default=dict)),
+                ('rows_fetched', models.IntegerField(default=0)),
+                ('rows_changed', models.IntegerField(default=0)),
+                ('rows_deleted', models.IntegerField(default=0)),
+                ('queue_items_created', models.IntegerField(default=0)),
+                ('statuses_updated', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-finished_at'],
+            },
+        ),
+    ]
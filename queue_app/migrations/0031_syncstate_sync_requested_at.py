@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0030_syncrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='sync_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
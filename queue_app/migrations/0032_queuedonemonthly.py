@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+# ปรับ queue_app_queuedonemonthly ตามแถวของ QueueItem ที่เข้า/ออกจากสถานะ DONE (Statement-level trigger)
+# ใช้ Transition table (old_rows / new_rows) รวมผลต่างต่อเดือนทีเดียวต่อ 1 Statement
+# Insert หลายแสนแถว (เช่น backfill_jobs) จึงปรับ Rollup แค่ไม่กี่แถว ไม่ใช่ทีละแถว
+ROLLUP_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION queue_done_monthly_rollup() RETURNS trigger AS $$
+DECLARE
+    done_id bigint;
+BEGIN
+    SELECT id INTO done_id FROM queue_app_queuestatus WHERE code = 'DONE';
+    IF done_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO queue_app_queuedonemonthly (month, done_count)
+        SELECT date_trunc('month', created_at)::date, count(*) FROM new_rows WHERE status_id = done_id GROUP BY 1
+        ON CONFLICT (month) DO UPDATE SET done_count = queue_app_queuedonemonthly.done_count + EXCLUDED.done_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE queue_app_queuedonemonthly AS r SET done_count = r.done_count - d.n
+        FROM (SELECT date_trunc('month', created_at)::date AS month, count(*) AS n
+              FROM old_rows WHERE status_id = done_id GROUP BY 1) AS d
+        WHERE r.month = d.month;
+    ELSE
+        INSERT INTO queue_app_queuedonemonthly (month, done_count)
+        SELECT month, sum(n) FROM (
+            SELECT date_trunc('month', created_at)::date AS month, -count(*) AS n
+            FROM old_rows WHERE status_id = done_id GROUP BY 1
+            UNION ALL
+            SELECT date_trunc('month', created_at)::date, count(*)
+            FROM new_rows WHERE status_id = done_id GROUP BY 1
+        ) AS delta
+        GROUP BY month
+        HAVING sum(n) <> 0
+        ON CONFLICT (month) DO UPDATE SET done_count = queue_app_queuedonemonthly.done_count + EXCLUDED.done_count;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER queue_done_monthly_insert AFTER INSERT ON queue_app_queueitem
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_done_monthly_rollup();
+CREATE TRIGGER queue_done_monthly_update AFTER UPDATE ON queue_app_queueitem
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_done_monthly_rollup();
+CREATE TRIGGER queue_done_monthly_delete AFTER DELETE ON queue_app_queueitem
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_done_monthly_rollup();
+
+-- ค่าเริ่มต้นจากข้อมูลที่มีอยู่แล้ว
+INSERT INTO queue_app_queuedonemonthly (month, done_count)
+SELECT date_trunc('month', q.created_at)::date, count(*)
+FROM queue_app_queueitem q
+JOIN queue_app_queuestatus s ON s.id = q.status_id
+WHERE s.code = 'DONE'
+GROUP BY 1;
+"""
+
+DROP_ROLLUP_FUNCTION_SQL = """
+DROP TRIGGER IF EXISTS queue_done_monthly_insert ON queue_app_queueitem;
+DROP TRIGGER IF EXISTS queue_done_monthly_update ON queue_app_queueitem;
+DROP TRIGGER IF EXISTS queue_done_monthly_delete ON queue_app_queueitem;
+DROP FUNCTION IF EXISTS queue_done_monthly_rollup();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0031_syncstate_sync_requested_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueDoneMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('done_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='queueitem',
+            index=models.Index(fields=['status', 'created_at'], name='queueitem_status_created_idx'),
+        ),
+        migrations.RunSQL(ROLLUP_FUNCTION_SQL, DROP_ROLLUP_FUNCTION_SQL),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0032_queuedonemonthly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('queue_item_id', models.IntegerField(db_index=True)),
+                ('queue_number', models.CharField(max_length=20)),
+                ('event_type', models.CharField(choices=[('created', 'สร้างคิว'), ('status', 'เปลี่ยนสถานะ'), ('urgent', 'เปลี่ยนความเร่งด่วน'), ('comment', 'แก้ไขหมายเหตุ'), ('deleted', 'ลบคิว')], max_length=20)),
+                ('old_value', models.TextField(blank=True, null=True)),
+                ('new_value', models.TextField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('actor', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_app', '0033_queueevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Members',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('password', models.CharField(max_length=128)),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('first_name', models.CharField(max_length=150)),
+                ('last_name', models.CharField(max_length=150)),
+                ('is_staff', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'members',
+                'managed': False,
+            },
+        ),
+    ]
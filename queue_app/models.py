@@ -108,6 +108,10 @@ class QueueItem(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # นับ/แสดงรายการตามสถานะในช่วงวันที่ (เช่น งานที่เสร็จในเดือนนี้) ด้วย Index Range Scan
+            models.Index(fields=['status', 'created_at'], name='queueitem_status_created_idx'),
+        ]
 
 class JobsBms(models.Model):
     """
@@ -159,15 +163,27 @@ class JobsBms(models.Model):
     difficulty = models.IntegerField(null=True, blank=True)
     job_category_type = models.CharField(max_length=50, null=True, blank=True)
 
+    # Hash ของข้อมูลที่ Sync มาล่าสุด ใช้เทียบว่าแถวจาก MSSQL มีการเปลี่ยนแปลงหรือไม่ (ถ้าไม่เปลี่ยนจะไม่เขียนทับ)
+    row_hash = models.CharField(max_length=32, null=True, blank=True)
+
     class Meta:
         db_table = 'jobs_bms'
         ordering = ['-req_date']
 
+    # รายการฟิลด์วันที่ที่ต้องการลบเศษวินาที (microsecond)
+    DATETIME_FIELDS = ['jobdate', 'assign_date', 'arrive_date', 'req_date', 
+                       'act_dstart', 'act_dfin', 'return_date', 'enterdate', 'outsource_date']
+
     def save(self, *args, **kwargs):
-        # รายการฟิลด์วันที่ที่ต้องการลบเศษวินาที (microsecond)
-        dt_fields = ['jobdate', 'assign_date', 'arrive_date', 'req_date', 
-                     'act_dstart', 'act_dfin', 'return_date', 'enterdate', 'outsource_date']
-        for field in dt_fields:
+        self.normalize_dates()
+        super().save(*args, **kwargs)
+
+    def normalize_dates(self):
+        """
+        ปรับรูปแบบฟิลด์วันที่ก่อนบันทึก (ใช้ร่วมกันทั้ง save() และการ Bulk Upsert ตอน Sync
+        เพราะ bulk_create จะไม่เรียก save())
+        """
+        for field in self.DATETIME_FIELDS:
             val = getattr(self, field)
             if val:
                 # ลบ microsecond ก่อนเสมอ
@@ -179,11 +195,127 @@ class JobsBms(models.Model):
                     val = val.replace(second=0, tzinfo=None)
                 
                 setattr(self, field, val)
-        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.jobno} - {self.description[:30]}"
 
+class SyncState(models.Model):
+    """
+    Model: SyncState
+    หน้าที่: เก็บสถานะการ Sync ข้อมูลจาก BMS แบบถาวร (ไม่หายเมื่อ restart)
+    - watermark: วันเวลาล่าสุดที่เคยเห็นการเปลี่ยนแปลงในใบงาน (High-water mark) ใช้สำหรับ Incremental Sync
+    - last_full_sync_at: เวลาที่ทำ Full Sync สำเร็จครั้งล่าสุด (ใช้ตัดสินใจว่าถึงรอบ Full Sync หรือยัง)
+    - sync_requested_at: คำขอ Sync ทันทีแบบ Manual (ข้ามรอบรอของ Adaptive interval)
+    """
+    name = models.CharField(max_length=50, unique=True) # ชื่อของงาน Sync เช่น 'bms_jobs'
+    watermark = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    # เวลาที่มีคนกดขอให้ Sync ทันที (/trigger-sync/) Scheduler จะ Sync ในรอบถัดไปแล้วล้างค่านี้
+    sync_requested_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} (watermark: {self.watermark})"
+
+class SyncRun(models.Model):
+    """
+    Model: SyncRun
+    หน้าที่: บันทึกผลการ Sync จาก BMS แต่ละรอบ (1 แถวต่อ 1 รอบ) ใช้ดูย้อนหลังและตรวจว่าข้อมูลค้าง (Sync lag) หรือไม่
+    - success = True เมื่อทุกขั้นตอนสำเร็จ (ข้อมูลบนหน้า Dashboard เป็นปัจจุบัน ณ finished_at)
+    - stage_timings: เวลาที่ใช้แต่ละขั้นตอน (วินาที) เช่น {"connect": 0.01, "new_jobs": 0.4}
+    ลบรอบที่เก่ากว่า SYNC_RUN_RETENTION_DAYS ออกอัตโนมัติ
+    """
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(db_index=True)
+    mode = models.CharField(max_length=20) # full / incremental
+    success = models.BooleanField(default=False)
+    stage_timings = models.JSONField(default=dict, blank=True)
+    rows_fetched = models.IntegerField(default=0)
+    rows_changed = models.IntegerField(default=0)
+    rows_deleted = models.IntegerField(default=0)
+    queue_items_created = models.IntegerField(default=0)
+    statuses_updated = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    @property
+    def duration(self):
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.finished_at} {self.mode} ({'ok' if self.success else 'failed'})"
+
+    class Meta:
+        ordering = ['-finished_at']
+
+class QueueNumberCounter(models.Model):
+    """
+    Model: QueueNumberCounter
+    หน้าที่: ตัวนับเลขคิวล่าสุดที่ออกไปแล้ว แยกตามรอบ (period) ใช้คู่กับ queue_numbers.allocate_queue_numbers()
+    - period: รหัสรอบการรีเซ็ตเลขคิว เช่น '' (ไม่รีเซ็ต), '20261018' (รายวัน), '202610' (รายเดือน)
+    - last_value: เลขคิวล่าสุดที่ถูกจองไปแล้วในรอบนั้น
+    ถูกล็อกด้วย SELECT ... FOR UPDATE ระหว่างจองเลข กันเลขซ้ำเมื่อหลาย Process สร้างคิวพร้อมกัน
+    """
+    period = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.period or 'all'}: {self.last_value}"
+
+class QueueDoneMonthly(models.Model):
+    """
+    Model: QueueDoneMonthly
+    หน้าที่: จำนวนคิวสถานะ DONE แยกตามเดือนของ created_at (Rollup) ให้การ์ด "เสร็จสิ้นเดือนนี้" อ่านแถวเดียว
+    ไม่ต้องนับจากตาราง QueueItem ที่โตขึ้นทุกเดือน
+    ค่าถูกปรับโดย Trigger ของ PostgreSQL บนตาราง QueueItem (ดู Migration 0032) จึงถูกต้องเสมอ
+    ไม่ว่าจะเปลี่ยนสถานะผ่าน save(), update() หรือ SQL ตรง (เช่น backfill_jobs)
+    """
+    month = models.DateField(unique=True) # วันที่ 1 ของเดือน
+    done_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.done_count}"
+
+class QueueEvent(models.Model):
+    """
+    Model: QueueEvent
+    หน้าที่: บันทึกการเปลี่ยนแปลงของ QueueItem แบบเพิ่มอย่างเดียว (Append-only) ใช้เป็น Audit trail
+    และ Delta feed (/api/changes/?since=<id>): id เรียงตามลำดับการ Commit (ดู queue_log.py) ใช้เป็นเวอร์ชัน
+    - event_type: created / status / urgent / comment / deleted
+    - old_value, new_value: ค่าก่อน/หลังเปลี่ยน (สถานะเก็บเป็น code เช่น WAITING -> ACTIVE)
+    - actor: ผู้ทำรายการ (ชื่อ Member ที่ล็อกอิน, ชื่อเครื่อง/IP หรือ bms-sync)
+    ไม่ผูก ForeignKey กับ QueueItem เพื่อให้ประวัติยังอยู่หลังคิวถูกลบ
+    """
+    EVENT_CREATED = 'created'
+    EVENT_STATUS = 'status'
+    EVENT_URGENT = 'urgent'
+    EVENT_COMMENT = 'comment'
+    EVENT_DELETED = 'deleted'
+    EVENT_TYPE_CHOICES = [
+        (EVENT_CREATED, 'สร้างคิว'),
+        (EVENT_STATUS, 'เปลี่ยนสถานะ'),
+        (EVENT_URGENT, 'เปลี่ยนความเร่งด่วน'),
+        (EVENT_COMMENT, 'แก้ไขหมายเหตุ'),
+        (EVENT_DELETED, 'ลบคิว'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    queue_item_id = models.IntegerField(db_index=True)
+    queue_number = models.CharField(max_length=20)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES)
+    old_value = models.TextField(null=True, blank=True)
+    new_value = models.TextField(null=True, blank=True)
+    # ข้อมูลเพิ่มเติมของ Event เช่น ข้อมูลผู้แจ้งของคิวที่สร้างใหม่ หรือ is_adhoc ของคิวแทรก
+    data = models.JSONField(default=dict, blank=True)
+    actor = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.queue_number} {self.event_type}: {self.old_value} -> {self.new_value}"
+
+    class Meta:
+        ordering = ['id']
+
 class Members(models.Model):
     id = models.BigAutoField(primary_key=True)
     password = models.CharField(max_length=128)
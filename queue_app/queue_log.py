@@ -0,0 +1,63 @@
+"""
+บันทึกการเปลี่ยนแปลงของคิว (QueueEvent) แบบเพิ่มอย่างเดียว ใช้เป็นทั้ง Audit trail และ Delta feed (/api/changes/)
+- id ของ QueueEvent คือเวอร์ชัน: Client เก็บ id ล่าสุดที่ได้ แล้วขอเฉพาะ Event ที่ id มากกว่านั้น
+- ทุกครั้งที่เขียน Event ต้องถือ Advisory lock ระดับ Transaction (QUEUE_EVENT_LOCK_KEY) จน Commit
+  ทำให้ id เรียงตามลำดับการ Commit: Client ที่อ่าน since=N จะไม่พลาด Event ที่ได้ id น้อยกว่าแต่ Commit ทีหลัง
+- ควรบันทึก Event ใน Transaction เดียวกับการเขียน QueueItem (ถ้าอย่างใดอย่างหนึ่งล้มเหลว จะ Rollback ทั้งคู่)
+- ลำดับ Lock: เรียก lock_event_log() เป็นคำสั่งแรกของ Transaction ก่อน save()/UPDATE/select_for_update ของ QueueItem
+  ทุกจุดที่เขียนคิว (View, Sync) ต้องถือ Lock ตามลำดับเดียวกัน ไม่เช่นนั้นจะเกิด Deadlock ระหว่างกัน
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from .models import QueueEvent
+
+# ผู้ทำรายการของการเปลี่ยนแปลงที่มาจากการ Sync ข้อมูล BMS
+ACTOR_SYNC = 'bms-sync'
+# ผู้ทำรายการของคิวย้อนหลังที่สร้างโดย backfill_jobs
+ACTOR_BACKFILL = 'bms-backfill'
+
+
+def lock_event_log():
+    """ ถือ Lock ของ Event log จนจบ Transaction ปัจจุบัน (ต้องเรียกภายใน transaction.atomic) """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [settings.QUEUE_EVENT_LOCK_KEY])
+
+
+def status_code(status):
+    return status.code if status is not None else None
+
+
+def new_event(item, event_type, actor, old_value=None, new_value=None, data=None):
+    """ สร้าง QueueEvent (ยังไม่บันทึก) ของ QueueItem item ส่งต่อให้ record_events() """
+    return QueueEvent(
+        queue_item_id=item.id,
+        queue_number=item.queue_number,
+        event_type=event_type,
+        old_value=None if old_value is None else str(old_value),
+        new_value=None if new_value is None else str(new_value),
+        data=data or {},
+        actor=actor[:100],
+    )
+
+
+def record_events(events):
+    """ บันทึก Event ทั้งหมดทีเดียว (Insert คำสั่งเดียว) ภายใต้ Lock ของ Event log """
+    if not events:
+        return []
+    with transaction.atomic():
+        lock_event_log()
+        return QueueEvent.objects.bulk_create(events)
+
+
+def serialize_event(event):
+    return {
+        'version': event.id,
+        'type': event.event_type,
+        'queue_item_id': event.queue_item_id,
+        'queue_number': event.queue_number,
+        'old': event.old_value,
+        'new': event.new_value,
+        'data': event.data,
+        'actor': event.actor,
+        'at': event.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
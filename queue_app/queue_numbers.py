@@ -0,0 +1,68 @@
+"""
+การออกเลขคิว (Queue number) จากตัวนับในฐานข้อมูล (QueueNumberCounter)
+แทนการอ่านคิวล่าสุดแล้วแยกเลขจาก 'IT-XXXX' และไล่เช็คเลขซ้ำกับเลขคิวทั้งหมดในระบบ
+- จองเลขเป็นช่วง (Block) ทีละหลายเลขได้ในครั้งเดียว สำหรับ Bulk insert
+- ล็อกแถวตัวนับด้วย SELECT ... FOR UPDATE ไม่ว่าจะมีกี่ Process ก็ไม่ได้เลขซ้ำกัน
+- ตั้งค่ารูปแบบเลขและรอบการรีเซ็ต (รายวัน/รายเดือน/รายปี) ได้ใน settings (QUEUE_NUMBER_*)
+หมายเหตุ: ผู้เรียกควรจองเท่าจำนวนแถวที่จะ Insert จริง (ดู sync_to_queue_items ที่หารายการใหม่หลังถือ Lock)
+ถ้า Transaction ที่จองเลขไป rollback ทีหลัง เลขช่วงนั้นจะถูกคืน (ตัวนับ rollback ไปด้วย) เลขจึงไม่ขาดช่วงและไม่ซ้ำ
+"""
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from .models import QueueNumberCounter
+
+# รูปแบบรหัสรอบ (period) ของแต่ละแบบการรีเซ็ต ใช้เป็น Key ของตัวนับและแทนค่า {period} ในเลขคิว
+RESET_PERIOD_FORMATS = {
+    'never': '',
+    'daily': '%Y%m%d',
+    'monthly': '%Y%m',
+    'yearly': '%Y',
+}
+
+
+def get_queue_number_config():
+    """ อ่านและตรวจสอบค่า QUEUE_NUMBER_* จาก settings คืนค่า (prefix, format, reset) """
+    prefix = getattr(settings, 'QUEUE_NUMBER_PREFIX', 'IT-')
+    number_format = getattr(settings, 'QUEUE_NUMBER_FORMAT', '{prefix}{number:05d}')
+    reset = getattr(settings, 'QUEUE_NUMBER_RESET', 'never')
+
+    if reset not in RESET_PERIOD_FORMATS:
+        raise ImproperlyConfigured(
+            f"QUEUE_NUMBER_RESET must be one of {', '.join(RESET_PERIOD_FORMATS)} (got {reset!r})"
+        )
+    if reset != 'never' and '{period' not in number_format:
+        # ถ้ารีเซ็ตเลขแต่ไม่มีรหัสรอบในเลขคิว เลขจะชนกับรอบก่อนหน้า (queue_number เป็น unique)
+        raise ImproperlyConfigured("QUEUE_NUMBER_FORMAT must contain {period} when QUEUE_NUMBER_RESET is not 'never'")
+    return prefix, number_format, reset
+
+
+def current_period(reset, now=None):
+    """ รหัสรอบปัจจุบันตามแบบการรีเซ็ต เช่น daily -> '20261018', never -> '' """
+    period_format = RESET_PERIOD_FORMATS[reset]
+    return (now or datetime.now()).strftime(period_format) if period_format else ''
+
+
+def allocate_queue_numbers(count, now=None):
+    """
+    จองเลขคิวใหม่ count เลขต่อกัน คืนค่าเป็น List ของเลขคิว (เรียงจากน้อยไปมาก)
+    ใช้ 1 แถวตัวนับต่อรอบ ล็อกแถวไว้จนจบ Transaction (เรียกซ้อนใน transaction.atomic ของผู้เรียกได้)
+    """
+    if count <= 0:
+        return []
+
+    prefix, number_format, reset = get_queue_number_config()
+    period = current_period(reset, now)
+
+    with transaction.atomic():
+        QueueNumberCounter.objects.get_or_create(period=period)
+        counter = QueueNumberCounter.objects.select_for_update().get(period=period)
+        first = counter.last_value + 1
+        counter.last_value += count
+        counter.save(update_fields=['last_value', 'updated_at'])
+
+    return [
+        number_format.format(prefix=prefix, period=period, number=number)
+        for number in range(first, first + count)
+    ]
@@ -1,6 +1,9 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from queue_app.utils import sync_jobs_from_mssql
-from queue_app.models import ShiftClosure
+from django.conf import settings
+from queue_app.utils import sync_jobs_from_mssql, BMS_SYNC_STATE_NAME
+from queue_app.models import ShiftClosure, SyncState
+from queue_app.leader import elector, leader_only
+from queue_app.dashboard_cache import bump_queue_version
 from django.utils import timezone
 import datetime
 import logging
@@ -37,6 +40,7 @@ def auto_close_shift_logic():
                  ShiftClosure.objects.create(
                      closed_by='System (Auto)'
                  )
+                 bump_queue_version()
                  logger.info(f"System Auto-Closed Shift at {now} (Reference Check: {shift_start_check})")
                  print(f"DEBUG: System Auto-Closed Shift at {now}")
              else:
@@ -58,37 +62,118 @@ def auto_open_shift_logic():
             opened_at=now,
             opened_by='System (Auto)'
         )
+        bump_queue_version()
         logger.info(f"System Auto-Opened Shift at {now}")
         print(f"DEBUG: System Auto-Opened Shift at {now}")
 
 import atexit
 import signal
 
-def start():
-    scheduler = BackgroundScheduler(daemon=True)
-    # ตั้งให้รัน Sync ทุกๆ 20 วินาที (ปรับเปลี่ยนได้ตามความเหมาะสม)
-    scheduler.add_job(sync_jobs_from_mssql, 'interval', seconds=20, id='sync_mssql_job', replace_existing=True)
+class AdaptiveSyncSchedule:
+    """
+    ตัดสินใจรอบการ Sync แบบปรับตามสถานการณ์ แทนการ Sync ทุก 20 วินาทีตายตัว
+    - พบการเปลี่ยนแปลง (ใบงานเปลี่ยน/คิวใหม่/สถานะเปลี่ยน) หรือมีคนกด Sync ทันที: เข้าโหมด Burst Sync ถี่ขึ้นชั่วคราว
+    - ไม่มีการเปลี่ยนแปลงติดกันหลายรอบ หรือปิดกะอยู่ (ShiftClosure): ยืดรอบออกทีละ 2 เท่า จนถึงค่าสูงสุด
+    ค่าอยู่ใน Memory ของ Process ที่เป็น Leader (ถ้าเปลี่ยน Leader จะเริ่มนับใหม่ที่รอบปกติ)
+    """
+    def __init__(self):
+        self.interval = settings.BMS_SYNC_INTERVAL
+        self.next_run_at = None
+        self.idle_runs = 0
+        self.burst_runs_left = 0
+
+    def is_due(self, now):
+        return self.next_run_at is None or now >= self.next_run_at
+
+    def start_burst(self):
+        self.burst_runs_left = settings.BMS_SYNC_BURST_RUNS
+        self.idle_runs = 0
+
+    def record_run(self, now, changed, shift_closed):
+        """ คำนวณรอบถัดไปจากผลของรอบที่เพิ่งรันเสร็จ """
+        if changed:
+            self.start_burst()
+        else:
+            self.idle_runs += 1
+
+        if self.burst_runs_left > 0:
+            self.burst_runs_left -= 1
+            self.interval = settings.BMS_SYNC_BURST_INTERVAL
+        elif shift_closed or self.idle_runs >= settings.BMS_SYNC_IDLE_RUNS:
+            self.interval = min(max(self.interval, settings.BMS_SYNC_INTERVAL) * 2, settings.BMS_SYNC_MAX_INTERVAL)
+        else:
+            self.interval = settings.BMS_SYNC_INTERVAL
+
+        self.next_run_at = now + datetime.timedelta(seconds=self.interval)
+
+
+sync_schedule = AdaptiveSyncSchedule()
+
+def adaptive_sync_tick():
+    """
+    Job ที่ถูกเรียกทุก BMS_SYNC_TICK วินาที: Sync เมื่อถึงรอบตาม sync_schedule หรือมีคำขอ Sync ทันที (/trigger-sync/)
+    """
+    now = datetime.datetime.now()
+    requested_at = SyncState.objects.filter(name=BMS_SYNC_STATE_NAME).values_list('sync_requested_at', flat=True).first()
+    if requested_at:
+        sync_schedule.start_burst()
+    elif not sync_schedule.is_due(now):
+        return
+
+    totals = sync_jobs_from_mssql()
+
+    if requested_at:
+        # ล้างคำขอที่ทำไปแล้ว (ถ้ามีคำขอใหม่เข้ามาระหว่าง Sync จะยังอยู่ และถูกทำในรอบถัดไป)
+        SyncState.objects.filter(name=BMS_SYNC_STATE_NAME, sync_requested_at__lte=requested_at).update(sync_requested_at=None)
+
+    changed = totals['changed'] + totals['deleted'] + totals['created'] + totals['updated'] > 0
+    shift_closed = ShiftClosure.objects.filter(opened_at__isnull=True).exists()
+    sync_schedule.record_run(datetime.datetime.now(), changed, shift_closed)
+    logger.debug(
+        "Next BMS sync in %ss (%s%s)",
+        sync_schedule.interval,
+        'burst' if sync_schedule.burst_runs_left else f'idle x{sync_schedule.idle_runs}',
+        ', shift closed' if shift_closed else '',
+    )
+
+def configure_jobs(scheduler):
+    """
+    เพิ่ม Job ทั้งหมดลงใน scheduler (ใช้ร่วมกันทั้ง BackgroundScheduler ในเว็บ และ BlockingScheduler ใน run_scheduler)
+    ทุก Job ห่อด้วย leader_only: เปิดหลาย Worker/Container ได้ แต่มีเพียง Leader ที่ทำงานจริง (ดู leader.py)
+    """
+    # Sync แบบ Adaptive: ตรวจทุก BMS_SYNC_TICK วินาที แต่ Sync จริงตามรอบของ AdaptiveSyncSchedule (5 - 120 วินาที)
+    # max_instances=1 / coalesce: ถ้ารอบก่อนยังไม่เสร็จ ไม่ซ้อนรอบใหม่
+    scheduler.add_job(leader_only(adaptive_sync_tick), 'interval', seconds=settings.BMS_SYNC_TICK, id='sync_mssql_job',
+                      replace_existing=True, max_instances=1, coalesce=True)
     
     # เพิ่ม Job สำหรับ Auto Close Shift
     # รันทุก 5 นาที ในช่วงเวลา 21:00 - 06:00
     # ใช้ cron expression: hour='21-23,0-6'
-    scheduler.add_job(auto_close_shift_logic, 'cron', hour='21-23,0-6', minute='*/5', id='auto_close_shift_job', replace_existing=True)
+    scheduler.add_job(leader_only(auto_close_shift_logic), 'cron', hour='21-23,0-6', minute='*/5', id='auto_close_shift_job', replace_existing=True)
     
     # เพิ่ม Job สำหรับ Auto Open Shift
     # รันเวลา 08:00 ของทุกวัน
-    scheduler.add_job(auto_open_shift_logic, 'cron', hour='8', minute='0', id='auto_open_shift_job', replace_existing=True)
-    
-    scheduler.start()
-    logger.info("APScheduler started: Syncing MSSQL jobs every 30 seconds.")
+    scheduler.add_job(leader_only(auto_open_shift_logic), 'cron', hour='8', minute='0', id='auto_open_shift_job', replace_existing=True)
+
+def log_started_jobs():
+    logger.info(f"APScheduler started: Syncing MSSQL jobs adaptively every {settings.BMS_SYNC_BURST_INTERVAL}-{settings.BMS_SYNC_MAX_INTERVAL} seconds.")
     logger.info("APScheduler started: Auto-close shift check enabled (21:00 - 06:00, every 5 mins).")
     logger.info("APScheduler started: Auto-open shift enabled (08:00).")
 
+def start():
+    """ เปิด scheduler แบบ Background ใน Process ของเว็บ (ใช้ตอน Dev / runserver) """
+    scheduler = BackgroundScheduler(daemon=True)
+    configure_jobs(scheduler)
+    scheduler.start()
+    log_started_jobs()
+
     # Graceful shutdown: ปิด scheduler ก่อนที่ Python จะปิด thread pool
     def shutdown_scheduler():
         try:
             scheduler.shutdown(wait=False)
         except Exception:
             pass
+        # ปล่อย Lock ทันที ให้ Process อื่นรับหน้าที่ต่อได้เลยไม่ต้องรอ Connection หลุด
+        elector.release()
 
     atexit.register(shutdown_scheduler)
-
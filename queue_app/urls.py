@@ -4,6 +4,10 @@ from . import views
 urlpatterns = [
     # หน้า Dashboard หลัก
     path('', views.dashboard, name='dashboard'),
+    # API: ข้อมูล Dashboard แบบ JSON (ตัวเลขสรุป + HTML เฉพาะส่วนที่เปลี่ยน)
+    path('api/dashboard/', views.dashboard_api, name='dashboard_api'),
+    # API: Delta feed - การเปลี่ยนแปลงของคิวหลังเวอร์ชันที่ระบุ (?since=<version>)
+    path('api/changes/', views.queue_changes, name='queue_changes'),
     
     # API: จัดการคิว (เพิ่ม/เรียก/จบ)
     path('add-queue/', views.add_queue_item, name='add_queue'),
@@ -27,4 +31,12 @@ urlpatterns = [
     # API: ระบบ Authentication สำหรับ Member
     path('login-member/', views.login_member, name='login_member'),
     path('logout-member/', views.logout_member, name='logout_member'),
+    
+    # API: ขอให้ Sync ข้อมูลจาก BMS ทันที
+    path('trigger-sync/', views.trigger_sync, name='trigger_sync'),
+    
+    # Monitoring: สถิติการ Sync / เวลาตอบสนอง (Prometheus)
+    path('events/', views.queue_events, name='queue_events'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('health/', views.health_view, name='health'),
 ]
@@ -1,26 +1,35 @@
-import pyodbc
-from .models import JobsBms
-from datetime import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from .models import JobsBms, QueueEvent, QueueItem, SyncRun, SyncState
+from .classification import classify_description
+from .bms_sources import MssqlSource, get_bms_source
+from . import metrics, queue_log
+from .dashboard_cache import bump_queue_version
+from datetime import datetime, timedelta
+from contextlib import ExitStack
 import socket
+import json
+import hashlib
+from collections import Counter
 from functools import lru_cache
-from nmb.NetBIOS import NetBIOS
 
-def sync_jobs_from_mssql():
-    """
-    เชื่อมต่อฐานข้อมูล MSSQL และดึงข้อมูลงานซ่อม (Sync Jobs) ตามเงื่อนไข
-    คืนค่าจำนวนรายการที่ sync ไปได้
-    """
-    count = 0
-    try:
-        conn = get_mssql_connection()
-        if not conn:
-            return 0
-            
-        cursor = conn.cursor()
-        
-        # 1. Sync รายการใหม่ที่เป็น Active หรือ Waiting (ตาม Logic เดิม)
-        # ---------------------------------------------------------
-        sql_new = """
+# ชื่อ record ใน SyncState ที่ใช้เก็บ watermark ของการ Sync ใบงาน
+BMS_SYNC_STATE_NAME = 'bms_jobs'
+
+# ฟิลด์ของ JobsBms ที่รับค่ามาจาก MSSQL (ยกเว้น jobno ซึ่งเป็น Key) ชื่อตรงกับคอลัมน์ใน Query
+JOB_SOURCE_FIELDS = [
+    'catagory', 'description', 'dept_tech', 'name', 'jobdate', 'assign_date',
+    'arrive_date', 'req_date', 'caller', 'sap_code', 'aname', 'note',
+    'act_dstart', 'act_dfin', 'job_status', 'return_date', 'enterdate',
+    'enterby', 'outsource_date', 'abb_desc', 'descriptions',
+]
+# ฟิลด์ทั้งหมดที่เขียนตอน Sync = ข้อมูลจาก MSSQL + ฟิลด์ที่คำนวณเอง (ดู classification.py)
+JOB_SYNC_FIELDS = JOB_SOURCE_FIELDS + ['difficulty', 'job_category_type']
+
+# ส่วน SELECT/FROM ที่ใช้ร่วมกันทั้ง Sync รอบที่ 1 และรอบที่ 2 (แก้ที่นี่ที่เดียว ไม่ให้ 2 Query ต่างกัน)
+# หมายเหตุ: difficulty และ job_category_type ไม่ได้คำนวณใน MSSQL แล้ว แต่คำนวณใน classify_description()
+JOB_SELECT_SQL = """
         SELECT
             jobs.jobno,
             jobs.catagory,
@@ -42,273 +51,439 @@ def sync_jobs_from_mssql():
             jobs.enterdate,
             jobs.enterby,
             jobs.outsource_date,
-            -- คอลัมน์ใหม่สำหรับระดับความยาก (1 = ง่ายที่สุด, 5 = ยากที่สุด)
-            CASE
-                -- ระดับ 5: ยากที่สุด (ระบบวิกฤต/ความปลอดภัย/โครงสร้างหลัก)
-                WHEN description LIKE N'%ระบบล่ม%' OR description LIKE N'%กู้ระบบ%' OR description LIKE N'%security%' OR 
-                        description LIKE N'%server%' OR description LIKE N'%firewall%' OR description LIKE N'%database%' OR
-                        description LIKE N'%ความปลอดภัย%'
-                THEN 5        
-                -- ระดับ 4: ค่อนข้างยาก (การติดตั้งใหญ่/ซ่อมซับซ้อน/กู้ข้อมูล)
-                WHEN description LIKE N'%ติดตั้งระบบใหม่%' OR description LIKE N'%เปลี่ยนอะไหล่%' OR description LIKE N'%ซ่อมบอร์ด%' OR 
-                        description LIKE N'%ไวรัส%' OR description LIKE N'%กู้ข้อมูล%' OR description LIKE N'%คอมพิวเตอร์(ชำรุด)%'
-                THEN 4        
-                -- ระดับ 2: ค่อนข้างง่าย (การเชื่อมต่อ/ย้ายจุด/เน็ตพื้นฐาน)
-                WHEN description LIKE N'%เพิ่มสายแลน%' OR description LIKE N'%ย้ายโทรศัพท์%' OR description LIKE N'%อินเทอร์เน็ต หลุด%' OR 
-                        description LIKE N'%อินเทอร์เน็ต ช้า%' OR description LIKE N'%ไฟดับ%'
-                THEN 2        
-                -- ระดับ 1: ง่ายที่สุด (อุปกรณ์ต่อพ่วง/การตั้งค่าเล็กน้อย)
-                WHEN description LIKE N'%ปรินเตอร์%' OR description LIKE N'%พิมพ์ ไม่ได้%' OR description LIKE N'%ตั้งค่า%' OR 
-                        description LIKE N'%เปลี่ยนรหัส%' OR description LIKE N'%เมาส์%' OR description LIKE N'%คีย์บอร์ด%'
-                THEN 1
-                        -- ระดับ 3: ปานกลาง (ค่าเริ่มต้น/ปัญหาทั่วไปที่ไม่เข้าข่ายระดับอื่น)
-                ELSE 3
-            END AS difficulty,
-            CASE
-                -- SERVER Category
-                WHEN description LIKE N'%server%' OR description LIKE N'%database%' OR description LIKE N'%firewall%' OR
-                        description LIKE N'%network core%' OR description LIKE N'%ระบบล่ม%' OR description LIKE N'%กู้ระบบ%'
-                THEN 'SERVER'        
-                -- APP Category
-                WHEN description LIKE N'%excel%' OR description LIKE N'%word%' OR description LIKE N'%windows%' OR
-                        description LIKE N'%ลงโปรแกรม%' OR description LIKE N'%ตั้งค่า%' OR description LIKE N'%รหัส%'
-                THEN 'APP'        
-                -- ENDPOINT Category
-                WHEN description LIKE N'%คอม%' OR description LIKE N'%computer%' OR description LIKE N'%จอ%' OR
-                        description LIKE N'%ปรินเตอร์%' OR description LIKE N'%พิมพ์%' OR description LIKE N'%เมาส์%' OR
-                        description LIKE N'%คีย์บอร์ด%' OR description LIKE N'%โทรศัพท์%' OR description LIKE N'%สายแลน%'
-                THEN 'ENDPOINT'        
-                -- Default Category
-                ELSE 'OTHER'
-                END AS job_category_type,
-                md.abb_desc,
-                md.descriptions
+            md.abb_desc,
+            md.descriptions
         FROM
             jobs
             left join employee e on e.emp_id = jobs.emp_id
-            left join m_dept md on jobs.dept = md.dept           
-                    WHERE jobs.job_status IN ('11', '1') 
-                    AND jobs.dept_control = '2'
-        ORDER BY
-            jobs.req_date
-        """
+            left join m_dept md on jobs.dept = md.dept
+"""
+
+# Subquery แปลง JSON array ของ jobno เป็นตาราง (ค่าเริ่มต้น OPENJSON ของ SQL Server, แต่ละ Source มีของตัวเอง)
+# ใช้ส่ง jobno ทั้งหมดเป็น Parameter เดียว แทนการต่อ String IN (...) ทีละ 50 รายการ
+JOB_IDS_FROM_JSON_SQL = MssqlSource.ids_subquery
+
+# เงื่อนไขแผนกช่าง: Sync เฉพาะใบงานที่ dept_tech ขึ้นต้นด้วย 'T' (เฉพาะแผนก Tech) หรือยังไม่ระบุแผนก
+# กรองที่ฝั่ง MSSQL เลย ใบงานของแผนกอื่นจะไม่ถูกส่งข้ามเครือข่ายมา
+TECH_DEPT_SQL = "(jobs.dept_tech IS NULL OR jobs.dept_tech = '' OR jobs.dept_tech LIKE 'T%')"
+
+
+# คอลัมน์วันที่ในตาราง jobs ที่ใช้ตรวจว่าใบงานถูกแก้ไขหลัง watermark หรือไม่
+WATERMARK_COLUMNS = [
+    'jobdate', 'req_date', 'assign_date', 'arrive_date', 'act_dstart',
+    'act_dfin', 'return_date', 'enterdate', 'outsource_date',
+]
+
+class WatermarkTracker:
+    """
+    ใช้ติดตามค่าวันที่ล่าสุด (High-water mark) จากแถวที่ดึงมาในรอบ Sync นี้
+    - complete = False หมายถึงมีบางส่วนของการ Sync ล้มเหลว จะไม่เลื่อน watermark
+    """
+    def __init__(self, latest=None):
+        self.latest = latest
+        self.complete = True
+        self.errors = []
+
+    def fail(self, error):
+        """ บันทึกว่าบางส่วนของรอบนี้ล้มเหลว (ไม่เลื่อน watermark) พร้อมข้อความ Error สำหรับ SyncRun """
+        self.complete = False
+        self.errors.append(error)
+
+    def observe(self, job):
+        # ไม่รับค่าวันที่ในอนาคต (เช่น วันนัดหมาย) เพื่อไม่ให้ watermark กระโดดข้ามการแก้ไขจริง
+        now = datetime.now()
+        for column in WATERMARK_COLUMNS:
+            value = getattr(job, column)
+            if value and value <= now and (self.latest is None or value > self.latest):
+                self.latest = value
+
+def touched_since_clause():
+    """
+    สร้างเงื่อนไข SQL สำหรับ Incremental Sync (ใบงานที่มีวันที่ใดๆ >= watermark)
+    ใช้คู่กับ parameter ที่สร้างจาก touched_since_params()
+    """
+    return '(' + ' OR '.join(f'jobs.{column} >= ?' for column in WATERMARK_COLUMNS) + ')'
+
+def touched_since_params(since):
+    return [since] * len(WATERMARK_COLUMNS)
+
+def get_sync_state():
+    state, _ = SyncState.objects.get_or_create(name=BMS_SYNC_STATE_NAME)
+    return state
+
+def request_sync():
+    """ ขอให้ Scheduler Sync ทันทีในรอบถัดไป (ไม่ต้องรอ Adaptive interval) """
+    get_sync_state()
+    SyncState.objects.filter(name=BMS_SYNC_STATE_NAME).update(sync_requested_at=datetime.now().replace(microsecond=0))
+
+def sync_jobs_from_mssql(full=None, source=None):
+    """
+    เชื่อมต่อฐานข้อมูล MSSQL และดึงข้อมูลงานซ่อม (Sync Jobs) ตามเงื่อนไข
+    คืนค่า Counter จำนวนแถวของรอบนี้ (ชุดเดียวกับที่บันทึกใน SyncRun):
+    fetched, changed, deleted (ใบงาน), created (คิวใหม่), updated (สถานะคิวที่เปลี่ยน)
+    - full=None: เลือกโหมดอัตโนมัติ (Incremental จาก watermark และ Full Sync ตามรอบ BMS_FULL_SYNC_INTERVAL)
+    - full=True: บังคับ Full Sync, full=False: บังคับ Incremental (ถ้ามี watermark แล้ว)
+    - source: แหล่งข้อมูล BMS (ดู bms_sources.py) ค่าเริ่มต้นตาม settings.BMS_SOURCE
+    """
+    source = source or get_bms_source()
+    count = 0
+    mode = 'full' if full else 'incremental'
+    timings = {}  # เวลาที่ใช้ในแต่ละขั้นตอน (วินาที) ดูได้ที่ /metrics และ SyncRun
+    totals = Counter()  # จำนวนแถวของรอบนี้ สำหรับ SyncRun
+    errors = []
+    started_at = datetime.now()
+    try:
+        state = get_sync_state()
         
-        cursor.execute(sql_new)
-        rows = cursor.fetchall()
+        # ตัดสินใจโหมดการ Sync: ถ้ายังไม่เคยมี watermark หรือถึงรอบ Full Sync ให้ดึงทั้งหมด
+        if full is None:
+            full = (
+                state.watermark is None
+                or state.last_full_sync_at is None
+                or started_at - state.last_full_sync_at >= timedelta(seconds=settings.BMS_FULL_SYNC_INTERVAL)
+            )
+        if state.watermark is None:
+            full = True
+        since = None if full else state.watermark - timedelta(seconds=settings.BMS_WATERMARK_OVERLAP)
+        mode = 'full' if full else 'incremental'
+        tracker = WatermarkTracker(state.watermark)
+        
+        # ยืม Connection จาก Source (MSSQL ใช้ Pool: ใช้ซ้ำข้ามรอบ Sync และตรวจสุขภาพก่อนใช้งาน)
+        with ExitStack() as stack:
+            with metrics.sync_stage('connect', timings):
+                conn = stack.enter_context(source.connection())
+                cursor = conn.cursor()
         
-        columns = [column[0] for column in cursor.description]
+            # 1. Sync รายการใหม่ที่เป็น Active หรือ Waiting (ตาม Logic เดิม)
+            # ---------------------------------------------------------
+            sql_new = JOB_SELECT_SQL + f"""
+            WHERE jobs.job_status IN ('11', '1')
+                AND jobs.dept_control = '2'
+                AND {TECH_DEPT_SQL}
+                {{touched_filter}}
+            ORDER BY
+                jobs.req_date
+            """
         
-        for row in rows:
-            data = dict(zip(columns, row))
-            update_or_create_job(data)
-            count += 1
+            new_stats = Counter()
+            with metrics.sync_stage('new_jobs', timings):
+                # Incremental: เพิ่มเงื่อนไขเฉพาะใบงานที่มีการเปลี่ยนแปลงหลัง watermark
+                if since:
+                    cursor.execute(sql_new.format(touched_filter=f"AND {touched_since_clause()}"), touched_since_params(since))
+                else:
+                    cursor.execute(sql_new.format(touched_filter=''))
+                
+                # อ่านทีละ Batch (fetchmany) แล้วบันทึกก่อนอ่าน Batch ถัดไป เพื่อจำกัดการใช้ Memory
+                for jobs in iter_job_batches(cursor):
+                    for job in jobs:
+                        tracker.observe(job)
+                    new_stats.update(bulk_upsert_jobs(jobs))
+            count = new_stats['fetched']
+            metrics.record_rows('new_jobs', new_stats)
             
-        print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Synced {count} new/active jobs from MSSQL.")
+            print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Synced {count} new/active jobs from MSSQL ({mode}): "
+                  f"{new_stats['changed']} changed, {new_stats['skipped']} unchanged.")
         
-        # 2. Sync Update สำหรับรายการที่มีอยู่แล้วในระบบทั้งหมด (Round 2 Sync)
-        # ---------------------------------------------------------
-        updated_count = sync_existing_jobs_updates(cursor, columns) # ส่ง cursor และ columns definition ไปใช้ต่อ
-        print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Updated {updated_count} existing jobs from MSSQL.")
+            # 2. Sync Update สำหรับรายการที่มีอยู่แล้วในระบบทั้งหมด (Round 2 Sync)
+            # ---------------------------------------------------------
+            with metrics.sync_stage('existing_jobs', timings):
+                existing_stats = sync_existing_jobs_updates(
+                    cursor, since=since, tracker=tracker, ids_subquery=source.ids_subquery) # ส่ง cursor ไปใช้ต่อ
+            metrics.record_rows('existing_jobs', existing_stats)
+            print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Updated {existing_stats['fetched']} existing jobs from MSSQL: "
+                  f"{existing_stats['changed']} changed, {existing_stats['skipped']} unchanged.")
+        
+            total_stats = new_stats + existing_stats
+            totals.update(total_stats)
+            print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Sync totals: fetched={total_stats['fetched']}, "
+                  f"changed={total_stats['changed']}, skipped={total_stats['skipped']}")
+        
+        # บันทึก watermark ใหม่เฉพาะเมื่อ Sync ใบงานครบทุกส่วน (ถ้ามีบางส่วนล้มเหลว รอบหน้าจะดึงซ้ำจาก watermark เดิม)
+        if tracker.complete:
+            state.watermark = tracker.latest
+            if full:
+                state.last_full_sync_at = started_at
+            # ระบุฟิลด์ ไม่ให้ทับ sync_requested_at ที่อาจถูกตั้งค่าระหว่างรอบ Sync นี้
+            state.save(update_fields=['watermark', 'last_full_sync_at', 'updated_at'])
         
         # หลังจาก Sync Job เสร็จ ให้เอา Job ไปสร้างเป็น QueueItem ต่อทันที
-        # หลังจาก Sync Job เสร็จ ให้เอา Job ไปสร้างเป็น QueueItem ต่อทันที
-        sync_to_queue_items()
+        with metrics.sync_stage('queue_items', timings):
+            created = sync_to_queue_items()
+        metrics.record_rows('queue_items', {'created': created})
         
         # เพิ่มเติม: Logic Update Status ตามเงื่อนไข Outsource Date
-        update_queue_status_from_logic()
+        with metrics.sync_stage('status_logic', timings):
+            updated = update_queue_status_from_logic()
+        metrics.record_rows('status_logic', {'updated': updated})
+        totals.update({'created': created, 'updated': updated})
+        # มีข้อมูลที่แสดงบน Dashboard เปลี่ยน (ใบงาน/คิวใหม่/สถานะ) ให้ Cache ของ Dashboard คำนวณใหม่
+        if totals['changed'] or totals['deleted'] or created or updated:
+            bump_queue_version()
+        
+        errors += tracker.errors
+        result = 'success' if tracker.complete else 'partial'
+        if tracker.complete:
+            metrics.SYNC_LAST_SUCCESS.set(round(datetime.now().timestamp(), 3))
             
     except Exception as e:
+        result = 'error'
+        errors.append(str(e))
         print(f"Error syncing from MSSQL: {e}")
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+    
+    record_sync_run(started_at, mode, result == 'success', timings, totals, errors)
+    metrics.SYNC_RUNS.inc(mode=mode, result=result)
+    metrics.record_pool(source.name, source.snapshot())
+    print(f"[{datetime.now().strftime('%d/%b/%Y %H:%M:%S')}] Sync stage timings (s): "
+          + ', '.join(f'{stage}={seconds:.3f}' for stage, seconds in timings.items()))
             
-    return count
+    return totals
 
-def get_mssql_connection():
+def record_sync_run(started_at, mode, success, timings, totals, errors):
     """
-    Function: เชื่อมต่อฐานข้อมูล MSSQL
-    หน้าที่: สร้าง Connection String เพื่อเชื่อมต่อไปยัง Server BMS (ระบบแจ้งซ่อมเก่า)
+    บันทึกผลการ Sync รอบนี้ลง SyncRun (1 แถวต่อรอบ) และลบประวัติที่เก่ากว่า SYNC_RUN_RETENTION_DAYS
+    ไม่ให้ Error ของการบันทึกประวัติทำให้การ Sync ล้ม
     """
-    # รายละเอียดการเชื่อมต่อ MSSQL
-    server = '173.16.200.103' 
-    database = 'BMSDB' 
-    username = 'kanchana_a' 
-    password = 'Bms@2025' 
-    
-    # ตรวจสอบ Driver ODBC ในเครื่อง
-    drivers = [driver for driver in pyodbc.drivers() if 'SQL Server' in driver]
-    if not drivers:
-        print("No SQL Server ODBC drivers found!")
-        return None
-    
-    # เลือกรุ่นใหม่กว่า (เช่น ODBC Driver 17/18) ก่อนรุ่นเก่า (SQL Server legacy driver)
-    # เพราะรุ่นเก่าอาจมีปัญหากับ TrustServerCertificate
-    newer_drivers = [d for d in drivers if 'ODBC Driver' in d]
-    driver = newer_drivers[-1] if newer_drivers else drivers[0]
-    
-    # สร้าง Connection String (รองรับ TrustServerCertificate สำหรับ Self-signed SSL)
-    conn_str = f'DRIVER={{{driver}}};SERVER={server};DATABASE={database};UID={username};PWD={password};TrustServerCertificate=yes'
     try:
-        return pyodbc.connect(conn_str)
+        finished_at = datetime.now()
+        SyncRun.objects.create(
+            started_at=started_at.replace(microsecond=0),
+            finished_at=finished_at.replace(microsecond=0),
+            mode=mode,
+            success=success,
+            stage_timings=timings,
+            rows_fetched=totals['fetched'],
+            rows_changed=totals['changed'],
+            rows_deleted=totals['deleted'],
+            queue_items_created=totals['created'],
+            statuses_updated=totals['updated'],
+            error='\n'.join(errors) or None,
+        )
+        if mode == 'full':
+            cutoff = finished_at - timedelta(days=settings.SYNC_RUN_RETENTION_DAYS)
+            SyncRun.objects.filter(finished_at__lt=cutoff).delete()
     except Exception as e:
-        print(f"Error connecting to MSSQL: {e}")
-        return None
+        print(f"Error recording sync run: {e}")
+
+def get_sync_freshness():
+    """
+    สรุปความสดใหม่ของข้อมูลจาก SyncRun ล่าสุด ใช้กับหน้า Dashboard ("ข้อมูล ณ") และ /health/
+    - data_as_of: เวลาที่ Sync สำเร็จครั้งล่าสุด
+    - stale: True ถ้าไม่มีรอบที่สำเร็จภายใน SYNC_STALE_AFTER วินาที
+    """
+    last_success = SyncRun.objects.filter(success=True).only('finished_at').first()
+    last_run = SyncRun.objects.only('finished_at', 'success', 'error').first()
+    now = datetime.now()
+    age = (now - last_success.finished_at).total_seconds() if last_success else None
+    return {
+        'data_as_of': last_success.finished_at if last_success else None,
+        'age_seconds': round(age) if age is not None else None,
+        'age_minutes': int(age // 60) if age is not None else None,
+        'stale': age is None or age > settings.SYNC_STALE_AFTER,
+        'last_run_at': last_run.finished_at if last_run else None,
+        'last_run_success': last_run.success if last_run else None,
+        'last_error': last_run.error if last_run and not last_run.success else None,
+    }
+
+def job_row_hash(job):
+    """
+    คำนวณ Hash (BLAKE2b 128 bit) จากค่าฟิลด์ใน JOB_SYNC_FIELDS ของ JobsBms ที่ปรับวันที่แล้ว
+    ใช้เป็นลายนิ้วมือ (Fingerprint) ของแถว เพื่อตรวจว่าข้อมูลจาก MSSQL เปลี่ยนไปจากที่เก็บไว้หรือไม่
+    """
+    values = ['\x00' if getattr(job, field) is None else str(getattr(job, field)) for field in JOB_SYNC_FIELDS]
+    return hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=16).hexdigest()
 
-def update_or_create_job(data):
+def job_from_row(row, index):
+    """
+    แปลงแถว (tuple) จาก MSSQL เป็น JobsBms (ยังไม่บันทึก) โดยไม่ต้องสร้าง dict ต่อแถว
+    - index: dict ชื่อคอลัมน์ -> ตำแหน่งใน tuple (จาก cursor.description)
+    - ปรับวันที่ด้วย JobsBms.normalize_dates() แบบเดียวกับ save()
+    - คำนวณ difficulty / job_category_type จาก description (classify_description) และ row_hash
+    """
+    job = JobsBms(jobno=row[index['jobno']], **{field: row[index[field]] for field in JOB_SOURCE_FIELDS})
+    job.normalize_dates()
+    job.difficulty, job.job_category_type = classify_description(job.description)
+    job.row_hash = job_row_hash(job)
+    return job
+
+def iter_job_batches(cursor, batch_size=None):
+    """
+    Generator: อ่านผลลัพธ์จาก cursor ทีละ batch_size แถว (fetchmany) และคืนค่าเป็น list ของ JobsBms
+    ผู้เรียกควรบันทึก Batch ปัจจุบันให้เสร็จก่อนขอ Batch ถัดไป ทำให้ใช้ Memory คงที่
+    ไม่ว่าผลลัพธ์จะมีกี่แถว (ระหว่างนั้น Driver ยังรับข้อมูลจาก Server ต่อได้)
+    """
+    batch_size = batch_size or settings.BMS_SYNC_BATCH_SIZE
+    index = {column[0]: i for i, column in enumerate(cursor.description)}
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [job_from_row(row, index) for row in rows]
+
+def bulk_upsert_jobs(jobs):
     """ 
-    Helper function to update or create a single Job record 
-    หน้าที่: อัปเดตข้อมูล JobsBms หรือสร้างใหม่ถ้ายังไม่มี (Upsert)
-    - data['jobno'] เป็น Key ในการค้นหา
-    - ตัด microseconds ออกจากวันที่เพื่อความสะอาดของข้อมูล
+    Helper function สำหรับ Upsert ข้อมูล JobsBms ทีละหลายรายการ (Set-based)
+    หน้าที่: อัปเดตข้อมูล JobsBms หรือสร้างใหม่ถ้ายังไม่มี ด้วย INSERT ... ON CONFLICT (jobno) DO UPDATE
+    - jobs คือ list ของ JobsBms ที่ได้จาก job_from_row() (ปรับวันที่และคำนวณ row_hash แล้ว)
+    - เทียบ row_hash กับที่เก็บไว้ และเขียนเฉพาะแถวที่เปลี่ยนจริง (ลด Write/WAL/Table bloat)
+    - คืนค่า Counter: fetched (จำนวนที่ได้รับ), changed (เขียนลง DB), skipped (ไม่เปลี่ยนแปลง)
     """
-    JobsBms.objects.update_or_create(
-        jobno=data['jobno'],
-        defaults={
-            'catagory': data['catagory'],
-            'description': data['description'],
-            'dept_tech': data['dept_tech'],
-            'name': data['name'],
-            'jobdate': data['jobdate'].replace(microsecond=0) if data['jobdate'] else None,
-            'assign_date': data['assign_date'].replace(microsecond=0) if data['assign_date'] else None,
-            'arrive_date': data['arrive_date'].replace(microsecond=0) if data['arrive_date'] else None,
-            'req_date': data['req_date'].replace(microsecond=0) if data['req_date'] else None,
-            'caller': data['caller'],
-            'sap_code': data['sap_code'],
-            'aname': data['aname'],
-            'note': data['note'],
-            'act_dstart': data['act_dstart'].replace(microsecond=0) if data['act_dstart'] else None,
-            'act_dfin': data['act_dfin'].replace(microsecond=0) if data['act_dfin'] else None,
-            'job_status': data['job_status'],
-            'return_date': data['return_date'].replace(microsecond=0) if data['return_date'] else None,
-            'enterdate': data['enterdate'].replace(microsecond=0) if data['enterdate'] else None,
-            'enterby': data['enterby'],
-            'outsource_date': data['outsource_date'].replace(microsecond=0) if data['outsource_date'] else None,
-            'difficulty': data['difficulty'],
-            'job_category_type': data['job_category_type'],
-            'abb_desc': data['abb_desc'],
-            'descriptions': data['descriptions'],
-        }
-    )
+    # ถ้ามี jobno ซ้ำในชุดเดียวกัน ให้ใช้แถวล่าสุด (ON CONFLICT อัปเดตแถวเดิมซ้ำใน Statement เดียวไม่ได้)
+    jobs_by_no = {job.jobno: job for job in jobs}
+        
+    stats = Counter(fetched=len(jobs_by_no))
+    if not jobs_by_no:
+        return stats
+        
+    # เทียบ Hash ใน Memory: ดึงเฉพาะ jobno และ row_hash ของรายการชุดนี้
+    stored_hashes = dict(JobsBms.objects.filter(jobno__in=jobs_by_no.keys()).values_list('jobno', 'row_hash'))
+    changed_jobs = [job for job in jobs_by_no.values() if stored_hashes.get(job.jobno) != job.row_hash]
+    stats['changed'] = len(changed_jobs)
+    stats['skipped'] = stats['fetched'] - stats['changed']
+    
+    if changed_jobs:
+        with transaction.atomic():
+            JobsBms.objects.bulk_create(
+                changed_jobs,
+                batch_size=settings.BMS_SYNC_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['jobno'],
+                update_fields=JOB_SYNC_FIELDS + ['row_hash'],
+            )
+    return stats
+
+def jobs_by_ids_sql(since=None, ids_subquery=JOB_IDS_FROM_JSON_SQL):
+    """
+    สร้าง SQL ดึงใบงานตามรายการ jobno (ส่งเป็น JSON array ใน Parameter ตัวแรก)
+    - ids_subquery เปลี่ยนได้สำหรับฐานข้อมูลอื่น (เช่น SQLite ใช้ json_each) ในการทดสอบ/Benchmark
+    - ถ้ามี since จะต่อเงื่อนไข Incremental ท้าย Query (Parameter ตามหลัง JSON)
+    """
+    sql = JOB_SELECT_SQL + f"""
+        WHERE
+            jobs.jobno IN ({ids_subquery})
+            AND {TECH_DEPT_SQL}
+        """
+    if since:
+        sql += f" AND {touched_since_clause()}"
+    return sql
+
+def non_tech_job_ids_sql(ids_subquery=JOB_IDS_FROM_JSON_SQL):
+    """
+    สร้าง SQL หา jobno (จาก JSON array ใน Parameter) ที่ถูกย้ายไปแผนกที่ไม่ใช่ Tech แล้ว
+    ดึงเฉพาะเลข jobno ไม่ดึงข้อมูลทั้งแถว
+    """
+    return f"SELECT jobs.jobno FROM jobs WHERE jobs.jobno IN ({ids_subquery}) AND NOT {TECH_DEPT_SQL}"
+
+def delete_non_tech_jobs(job_nos):
+    """
+    ลบใบงานที่ไม่ใช่แผนก Tech ออกจากระบบคิว (ทั้ง QueueItem และ JobsBms) แบบ Set-based
+    ใน Transaction เดียว (2 คำสั่ง DELETE ไม่ว่าจะมีกี่รายการ)
+    """
+    if not job_nos:
+        return 0
+    with transaction.atomic():
+        items = QueueItem.objects.filter(linked_job_no__in=job_nos)
+        queue_log.record_events([
+            queue_log.new_event(item, QueueEvent.EVENT_DELETED, queue_log.ACTOR_SYNC, data={'linked_job_no': item.linked_job_no})
+            for item in items.only('id', 'queue_number', 'linked_job_no')
+        ])
+        items.delete()
+        deleted, _ = JobsBms.objects.filter(jobno__in=job_nos).delete()
+    print(f"Deleted {deleted} jobs moved out of Tech departments: {sorted(job_nos)}")
+    return deleted
 
-def sync_existing_jobs_updates(cursor, columns_template=None):
+def sync_existing_jobs_updates(cursor, since=None, tracker=None, ids_subquery=JOB_IDS_FROM_JSON_SQL):
     """
     Sync รอบที่ 2: ดึงข้อมูลของ Job ที่มีอยู่แล้วใน Local DB ทั้งหมด
     กลับไปเช็คที่ MSSQL ว่ามีการอัปเดตหรือไม่ (เช่น เปลี่ยนสถานะเป็น Closed)
     Logic:
-    1. ดึง ID (jobno) ทั้งหมดจาก Local DB
-    2. แบ่ง ID เป็น Chunk (ชุดละ 50) เพื่อไม่ให้ Query ยาวเกินไป
-    3. สร้าง SQL Query โดยใช้ WHERE IN (...) เพื่อดึงข้อมูลอัปเดตเฉพาะ ID เหล่านั้น
+    1. ดึง ID (jobno) ของ Job ที่ยังไม่เสร็จจาก Local DB
+    2. หา ID ที่ถูกย้ายไปแผนกอื่น (dept_tech ไม่ขึ้นต้นด้วย 'T') แล้วลบออกทีเดียว
+    3. ส่ง ID ที่เหลือเป็น JSON array ใน Parameter เดียว (OPENJSON) ดึงข้อมูลครั้งเดียว (1 Round trip)
+    4. ถ้ามี since (Incremental) จะดึงเฉพาะใบงานที่มีวันที่เปลี่ยนแปลงหลัง since
+    คืนค่า Counter ของจำนวน fetched / changed / skipped (ดู bulk_upsert_jobs)
     """
-    updated_count = 0
+    stats = Counter()
     
     # 1. ดึง ID ของ Job เฉพาะที่ยังไม่เสร็จ (ไม่รวมสถานะ 2=ซ่อมเสร็จ, 12=ตรวจรับงาน) เพื่อเช็คอัปเดต
     all_job_ids = list(JobsBms.objects.exclude(job_status__in=['2', '12']).values_list('jobno', flat=True))
     
     if not all_job_ids:
-        return 0
+        return stats
         
-    # 2. แบ่งเป็น Chunk (เช่น ทีละ 50 ID) เพื่อไม่ให้ Query ยาวเกินไป
-    chunk_size = 50
-    for i in range(0, len(all_job_ids), chunk_size):
-        chunk_ids = all_job_ids[i:i + chunk_size]
+    try:
+        # 2. Check dept_tech condition: ใบงานที่ถูกย้ายออกจากแผนก Tech ให้ลบออก (เช็คทุกรอบ ไม่ขึ้นกับ watermark)
+        cursor.execute(non_tech_job_ids_sql(ids_subquery), [json.dumps(all_job_ids)])
+        non_tech_ids = {row[0] for row in cursor.fetchall()}
+        stats['deleted'] = delete_non_tech_jobs(non_tech_ids)
         
-        if not chunk_ids:
-            continue
-            
-        # สร้างเงื่อนไข IN (...)
-        ids_placeholder = ', '.join(map(str, chunk_ids))
+        job_ids = [jobno for jobno in all_job_ids if jobno not in non_tech_ids]
+        if not job_ids:
+            return stats
         
-        # Reuse SQL query logic but filter by specific IDs
-        sql = f"""
-        SELECT
-            jobs.jobno,
-            jobs.catagory,
-            jobs.description,
-            jobs.dept_tech,
-            e.name,
-            jobs.jobdate,
-            jobs.assign_date,
-            jobs.arrive_date,
-            jobs.req_date,
-            jobs.caller,
-            jobs.sap_code,
-            jobs.aname,
-            jobs.note,
-            jobs.act_dstart,
-            jobs.act_dfin,
-            jobs.job_status,
-            jobs.return_date,
-            jobs.enterdate,
-            jobs.enterby,
-            jobs.outsource_date,
-             CASE
-                WHEN description LIKE N'%ระบบล่ม%' OR description LIKE N'%กู้ระบบ%' OR description LIKE N'%security%' OR 
-                        description LIKE N'%server%' OR description LIKE N'%firewall%' OR description LIKE N'%database%' OR
-                        description LIKE N'%ความปลอดภัย%' THEN 5        
-                WHEN description LIKE N'%ติดตั้งระบบใหม่%' OR description LIKE N'%เปลี่ยนอะไหล่%' OR description LIKE N'%ซ่อมบอร์ด%' OR 
-                        description LIKE N'%ไวรัส%' OR description LIKE N'%กู้ข้อมูล%' OR description LIKE N'%คอมพิวเตอร์(ชำรุด)%' THEN 4        
-                WHEN description LIKE N'%เพิ่มสายแลน%' OR description LIKE N'%ย้ายโทรศัพท์%' OR description LIKE N'%อินเทอร์เน็ต หลุด%' OR 
-                        description LIKE N'%อินเทอร์เน็ต ช้า%' OR description LIKE N'%ไฟดับ%' THEN 2        
-                WHEN description LIKE N'%ปรินเตอร์%' OR description LIKE N'%พิมพ์ ไม่ได้%' OR description LIKE N'%ตั้งค่า%' OR 
-                        description LIKE N'%เปลี่ยนรหัส%' OR description LIKE N'%เมาส์%' OR description LIKE N'%คีย์บอร์ด%' THEN 1
-                ELSE 3
-            END AS difficulty,
-            CASE
-                WHEN description LIKE N'%server%' OR description LIKE N'%database%' OR description LIKE N'%firewall%' OR
-                        description LIKE N'%network core%' OR description LIKE N'%ระบบล่ม%' OR description LIKE N'%กู้ระบบ%' THEN 'SERVER'        
-                WHEN description LIKE N'%excel%' OR description LIKE N'%word%' OR description LIKE N'%windows%' OR
-                        description LIKE N'%ลงโปรแกรม%' OR description LIKE N'%ตั้งค่า%' OR description LIKE N'%รหัส%' THEN 'APP'        
-                WHEN description LIKE N'%คอม%' OR description LIKE N'%computer%' OR description LIKE N'%จอ%' OR
-                        description LIKE N'%ปรินเตอร์%' OR description LIKE N'%พิมพ์%' OR description LIKE N'%เมาส์%' OR
-                        description LIKE N'%คีย์บอร์ด%' OR description LIKE N'%โทรศัพท์%' OR description LIKE N'%สายแลน%' THEN 'ENDPOINT'        
-                ELSE 'OTHER'
-                END AS job_category_type,
-                md.abb_desc,
-                md.descriptions
-        FROM
-            jobs
-            left join employee e on e.emp_id = jobs.emp_id
-            left join m_dept md on jobs.dept = md.dept           
-        WHERE 
-            jobs.jobno IN ({ids_placeholder})
-        """
+        # 3. Query เดียวแบบ Parameterized (ไม่ต่อ String จาก ID โดยตรง)
+        params = [json.dumps(job_ids)]
+        if since:
+            params += touched_since_params(since)
+        cursor.execute(jobs_by_ids_sql(since, ids_subquery), params)
         
-        try:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
+        for jobs in iter_job_batches(cursor):
+            if tracker:
+                for job in jobs:
+                    tracker.observe(job)
+            stats.update(bulk_upsert_jobs(jobs))
             
-            # ถ้าไม่มี columns_template ให้หาจาก cursor (เผื่อกรณีใช้แยก)
-            columns = [column[0] for column in cursor.description]
+    except Exception as e:
+        print(f"Error syncing existing jobs ({len(all_job_ids)} ids): {e}")
+        metrics.SYNC_ERRORS.inc(stage='existing_jobs')
+        if tracker:
+            tracker.fail(f"existing_jobs: {e}")
             
-            for row in rows:
-                data = dict(zip(columns, row))
-                
-                # Check dept_tech condition: Must start with 'T' (เฉพาะแผนก Tech)
-                dept_tech = data.get('dept_tech', '')
-                if dept_tech and not dept_tech.startswith('T'):
-                    from .models import QueueItem
-                    QueueItem.objects.filter(linked_job_no=data['jobno']).delete()
-                    JobsBms.objects.filter(jobno=data['jobno']).delete()
-                    print(f"Deleted Job {data['jobno']} because dept_tech '{dept_tech}' does not start with 'T'")
-                    continue
+    return stats
 
-                update_or_create_job(data)
-                updated_count += 1
-                
-        except Exception as e:
-            print(f"Error syncing chunk {chunk_ids}: {e}")
-            
-    return updated_count
+# สร้าง QueueItem ของใบงานใหม่ทั้งหมดใน Statement เดียว (ทำงานฝั่ง PostgreSQL ทั้งหมด)
+# - รับคู่ (เลขคิว, jobno) ที่จองไว้แล้วเป็น Array 2 ชุด แล้ว JOIN กับ JobsBms เพื่อเอาข้อมูลผู้แจ้ง
+# - ON CONFLICT DO NOTHING กันใบงานซ้ำ กรณีมีอีก Process สร้างคิวของใบงานเดียวกันไปก่อน
+# - บันทึก QueueEvent 'created' ของทุกคิวที่สร้างได้จริงใน Statement เดียวกัน (ดู queue_log.py)
+QUEUE_ITEMS_FROM_JOBS_SQL = """
+    WITH created AS (
+        INSERT INTO {queue_table} (
+            queue_number, user_name, user_department, issue_description, created_at,
+            status_id, linked_job_no, is_urgent, is_adhoc
+        )
+        SELECT
+            n.queue_number,
+            COALESCE(NULLIF(j.caller, ''), 'Unknown'),
+            COALESCE(NULLIF(j.descriptions, ''), 'Unknown'),
+            COALESCE(j.description, ''),
+            COALESCE(j.req_date, %s),
+            %s, j.jobno, 0, 0
+        FROM unnest(%s::text[], %s::integer[]) WITH ORDINALITY AS n(queue_number, jobno, position)
+        JOIN {jobs_table} j ON j.jobno = n.jobno
+        ORDER BY n.position
+        ON CONFLICT DO NOTHING
+        RETURNING id, queue_number, linked_job_no, user_name, user_department, created_at
+    ), logged AS (
+        INSERT INTO {event_table} (queue_item_id, queue_number, event_type, new_value, data, actor, created_at)
+        SELECT id, queue_number, %s, %s,
+            jsonb_build_object('linked_job_no', linked_job_no, 'user_name', user_name,
+                               'user_department', user_department, 'created_at', created_at),
+            %s, %s
+        FROM created ORDER BY id
+    )
+    SELECT queue_number, linked_job_no FROM created ORDER BY id
+"""
 
 def sync_to_queue_items():
     """
     Sync ข้อมูลจาก JobsBms ไปยัง QueueItem (ตารางคิว)
     - สร้าง QueueItem เฉพาะรายการใหม่ที่ยังไม่เคยมี (เช็คจาก linked_job_no)
-    - กำหนดเลขคิวรันต่อเนื่อง (IT-XXXX)
+    - กำหนดเลขคิวจากตัวนับ (ดู queue_numbers.py) เรียงตามวันที่แจ้งซ่อม
     - ตั้งสถานะเริ่มต้นเป็น Waiting
+    หาใบงานใหม่ด้วย NOT EXISTS (Anti-join) และสร้างด้วย INSERT ... SELECT คำสั่งเดียว
+    เวลาที่ใช้ขึ้นกับจำนวนใบงานใหม่ ไม่ใช่ขนาดของตารางคิว
     """
-    from .models import QueueItem, QueueStatus, JobsBms
+    from .models import QueueItem, QueueStatus, JobsBms, QueueEvent
+    from .queue_numbers import allocate_queue_numbers
     
     # ตรวจสอบว่ามีสถานะเริ่มต้น 'Waiting' หรือยัง
     try:
@@ -320,108 +495,105 @@ def sync_to_queue_items():
             defaults={'code': 'waiting', 'name': 'Waiting', 'color': 'warning'}
         )
     
-    # ดึง Job ที่ยังไม่เคย Sync โดยเรียงตามวันที่แจ้งซ่อม (req_date)
-    # เราใช้ linked_job_no เพื่อตรวจสอบว่าเคยมีแล้วหรือยังใน QueueItem
-    existing_linked_ids = QueueItem.objects.filter(linked_job_no__isnull=False).values_list('linked_job_no', flat=True)
-    
-    jobs_to_sync = JobsBms.objects.exclude(jobno__in=existing_linked_ids).order_by('req_date')
-    
-    # เอา Query การหาคิวล่าสุดไว้นอกลูปเพื่อ Performance
-    last_item = QueueItem.objects.all().order_by('id').last()
-    if last_item and last_item.queue_number.startswith('IT-'):
-        try:
-            current_num = int(last_item.queue_number.split('-')[1])
-        except ValueError:
-            current_num = 0
-    else:
-        current_num = 0
-        
-    # ดึงหมายเลขคิวทั้งหมดที่มีอยู่ในระบบมาเป็น Set ของ Python เพื่อเช็คซ้ำใน RAM แทนที่จะเช็คใน Database
-    existing_q_numbers = set(QueueItem.objects.values_list('queue_number', flat=True))
-    
-    new_queue_items = []
+    sql = QUEUE_ITEMS_FROM_JOBS_SQL.format(
+        queue_table=QueueItem._meta.db_table,
+        jobs_table=JobsBms._meta.db_table,
+        event_table=QueueEvent._meta.db_table,
+    )
+    now = datetime.now().replace(microsecond=0)
+    with transaction.atomic():
+        queue_log.lock_event_log()
+        # ดึงเฉพาะ jobno ของ Job ที่ยังไม่เคย Sync (ยังไม่มี QueueItem ที่ linked_job_no ตรงกัน) เรียงตาม req_date
+        # ต้องหาหลังถือ Lock: ทุกจุดที่สร้าง QueueItem ถือ Lock เดียวกัน รายการนี้จึงไม่ชนกับใครตอน Insert
+        # และจองเลขคิวเท่าจำนวนที่ Insert จริง (ถ้าหาก่อนถือ Lock แถวที่ชน ON CONFLICT จะทำให้เลขคิวขาดช่วง)
+        new_job_nos = list(
+            JobsBms.objects
+            .filter(~Exists(QueueItem.objects.filter(linked_job_no=OuterRef('jobno'))))
+            .order_by('req_date', 'jobno')
+            .values_list('jobno', flat=True)
+        )
+        if not new_job_nos:
+            return 0
+        # จองเลขคิวทีเดียวทั้งช่วง (1 แถวตัวนับ) แล้ว Insert ทั้งหมดใน Statement เดียว
+        queue_numbers = allocate_queue_numbers(len(new_job_nos))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                now, waiting_status.id, queue_numbers, new_job_nos,
+                QueueEvent.EVENT_CREATED, waiting_status.code, queue_log.ACTOR_SYNC, now,
+            ])
+            created = cursor.fetchall()
     
-    for job in jobs_to_sync:
-        current_num += 1
-        queue_number = f"IT-{current_num:04d}"
-        
-        # ป้องกันเลขซ้ำ (เช็คจากตัวแปร Set ใน Memory จะเร็วกว่า Database เป็นพันเท่า)
-        while queue_number in existing_q_numbers:
-            current_num += 1
-            queue_number = f"IT-{current_num:04d}"
-            
-        existing_q_numbers.add(queue_number) # จำเลขที่ใช้ไปแล้ว
-        
-        # รวบรวมข้อมูลลง List เตรียมนำไป Insert ทีเดียว
-        new_queue_items.append(
-            QueueItem(
-                queue_number=queue_number,
-                user_name=job.caller or 'Unknown',
-                user_department=job.descriptions or 'Unknown',
-                issue_description=job.description or '',
-                created_at=job.req_date,
-                status=waiting_status,
-                linked_job_no=job.jobno
+    for queue_number, jobno in created:
+        print(f"Prepared QueueItem {queue_number} for Job {jobno}")
+    if created:
+        print(f"Bulk Created {len(created)} QueueItems from MSSQL Sync.")
+    return len(created)
+
+# ปรับสถานะ QueueItem ตาม outsource_date ของใบงานใน Statement เดียว (UPDATE ... FROM jobs_bms)
+# - มี outsource_date และยังไม่เสร็จ (Done) -> สถานะ 5 (รอประสานงาน/รออะไหล่)
+# - outsource_date ถูกลบออก และยังเป็นสถานะ 5 อยู่ -> กลับเป็นสถานะ 1 (Waiting)
+# WHERE เลือกเฉพาะแถวที่สถานะเป้าหมายต่างจากสถานะปัจจุบัน แถวที่ถูกต้องอยู่แล้วจะไม่ถูกเขียนซ้ำ
+# JOIN ตัวเองเป็น old เพื่ออ่านสถานะก่อน Update แล้วบันทึก QueueEvent 'status' ใน Statement เดียวกัน
+QUEUE_STATUS_FROM_JOBS_SQL = """
+    WITH changed AS (
+        UPDATE {queue_table} AS q
+        SET status_id = CASE WHEN j.outsource_date IS NOT NULL THEN %(coordinating)s ELSE %(waiting)s END
+        FROM {jobs_table} AS j, {queue_table} AS old
+        WHERE j.jobno = q.linked_job_no
+            AND old.id = q.id
+            AND (
+                (j.outsource_date IS NOT NULL
+                    AND q.status_id IS DISTINCT FROM %(coordinating)s
+                    AND q.status_id IS DISTINCT FROM %(done)s)
+                OR (j.outsource_date IS NULL AND q.status_id = %(coordinating)s)
             )
-        )
-        print(f"Prepared QueueItem {queue_number} for Job {job.jobno}")
-        
-    # ใช้ bulk_create สร้างทั้งหมดในการต่อฐานข้อมูล 1 ครั้ง
-    if new_queue_items:
-        QueueItem.objects.bulk_create(new_queue_items)
-        print(f"Bulk Created {len(new_queue_items)} QueueItems from MSSQL Sync.")
+        RETURNING q.id, q.queue_number, old.status_id AS old_status_id, q.status_id
+    ), logged AS (
+        INSERT INTO {event_table} (queue_item_id, queue_number, event_type, old_value, new_value, data, actor, created_at)
+        SELECT c.id, c.queue_number, %(event_type)s, old_status.code, new_status.code, '{{}}'::jsonb, %(actor)s, %(now)s
+        FROM changed c
+        LEFT JOIN {status_table} old_status ON old_status.id = c.old_status_id
+        LEFT JOIN {status_table} new_status ON new_status.id = c.status_id
+        ORDER BY c.id
+    )
+    SELECT status_id FROM changed
+"""
 
 def update_queue_status_from_logic():
     """
     อัปเดตสถานะของ QueueItem ตาม Business Logic เพิ่มเติม
     1. ถ้ามี outsource_date ให้เป็นสถานะ ID 5 (รอประสานงาน/รออะไหล่)
-    2. ยกเลิกการใช้ ID 6 (รออะไหล่) โดยย้ายไป 5 ทั้งหมด
+    2. ถ้า outsource_date ถูกลบออก ให้สถานะ 5 กลับเป็น ID 1 (Waiting)
+    ทำใน UPDATE คำสั่งเดียว เวลาที่ใช้ขึ้นกับจำนวนแถวที่ต้องเปลี่ยนจริง
+    (การย้ายสถานะ ID 6 -> 5 แบบครั้งเดียว อยู่ใน Migration 0029 แล้ว)
     """
-    from .models import QueueItem, QueueStatus, JobsBms
+    from .models import QueueItem, QueueStatus, JobsBms, QueueEvent
     
-    # 1. จัดการ Status ID 6 -> 5
-    try:
-        status_5 = QueueStatus.objects.get(id=5)
-        
-        # ย้ายรายการที่เคยเป็น 6 มาเป็น 5
-        QueueItem.objects.filter(status__id=6).update(status=status_5)
-        
-        # ลบ Status 6 ทิ้ง (ถ้าต้องการทำความสะอาด DB)
-        QueueStatus.objects.filter(id=6).delete()
-        
-    except QueueStatus.DoesNotExist:
-        pass
-        
-    # 2. Update Status เป็น 5 ถ้ามี outsource_date
-    # เราเลือกเฉพาะรายการที่ยังไม่เสร็จ (Done) หรือ Active หรือ Waiting
-    # และต้องไม่เป็นสถานะ 5 อยู่แล้ว (เพื่อลด load update)
+    # ต้องมีสถานะ 1, 5 และ DONE ครบก่อน (เหมือนเดิมที่ข้ามไปถ้า DoesNotExist)
+    done_status = QueueStatus.objects.filter(code='DONE').values_list('id', flat=True).first()
+    if done_status is None or QueueStatus.objects.filter(id__in=[1, 5]).count() < 2:
+        return 0
     
-    try:
-        status_5 = QueueStatus.objects.get(id=5)
-        status_1 = QueueStatus.objects.get(id=1)
-        done_status = QueueStatus.objects.get(code='DONE')
-        
-        # 2.1 Case: มี outsource_date -> Set Status 5
-        jobs_with_outsource = JobsBms.objects.exclude(outsource_date__isnull=True).values_list('jobno', flat=True)
-        
-        target_items_to_5 = QueueItem.objects.filter(linked_job_no__in=jobs_with_outsource).exclude(status=done_status).exclude(status=status_5)
-        updated_count_5 = target_items_to_5.update(status=status_5)
-        
-        if updated_count_5 > 0:
-            print(f"Updated {updated_count_5} items to Status 5 (Coordinating) due to outsource_date present.")
-
-        # 2.2 Case: outsource_date เป็นค่าว่าง (ถูกลบออก) -> Revert Status 5 กลับเป็น 1 (Waiting)
-        # เฉพาะรายการที่เป็น Status 5 อยู่
-        jobs_without_outsource = JobsBms.objects.filter(outsource_date__isnull=True).values_list('jobno', flat=True)
-        
-        target_items_to_1 = QueueItem.objects.filter(linked_job_no__in=jobs_without_outsource, status=status_5)
-        updated_count_1 = target_items_to_1.update(status=status_1)
-        
-        if updated_count_1 > 0:
-            print(f"Updated {updated_count_1} items back to Status 1 (Waiting) due to outsource_date cleared.")
-
-    except QueueStatus.DoesNotExist:
-        pass
+    sql = QUEUE_STATUS_FROM_JOBS_SQL.format(
+        queue_table=QueueItem._meta.db_table,
+        jobs_table=JobsBms._meta.db_table,
+        event_table=QueueEvent._meta.db_table,
+        status_table=QueueStatus._meta.db_table,
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        queue_log.lock_event_log()
+        cursor.execute(sql, {
+            'coordinating': 5, 'waiting': 1, 'done': done_status,
+            'event_type': QueueEvent.EVENT_STATUS, 'actor': queue_log.ACTOR_SYNC,
+            'now': datetime.now().replace(microsecond=0),
+        })
+        updated = Counter(row[0] for row in cursor.fetchall())
+    
+    if updated[5] > 0:
+        print(f"Updated {updated[5]} items to Status 5 (Coordinating) due to outsource_date present.")
+    if updated[1] > 0:
+        print(f"Updated {updated[1]} items back to Status 1 (Waiting) due to outsource_date cleared.")
+    return sum(updated.values())
 
 @lru_cache(maxsize=128)
 def get_hostname_from_ip(ip_address):
@@ -433,7 +605,9 @@ def get_hostname_from_ip(ip_address):
         pass
     
     # 2. ถ้ามาจาก VPN และ DNS ไม่รู้จัก ให้ลองใช้ NetBIOS ยิงไปถามเครื่อง Windows ตรงๆ
+    # import ตอนใช้งานจริง ไม่ให้ pysmb ถูกโหลดทุกครั้งที่ import utils (เช่น Management command)
     try:
+        from nmb.NetBIOS import NetBIOS
         bios = NetBIOS()
         # ยิงคำถามไปที่ IP ปกติรอ 2 วินาที
         names = bios.queryIPForName(ip_address, timeout=2)
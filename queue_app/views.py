@@ -1,68 +1,116 @@
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.utils import timezone
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
+from django.core.paginator import Page, Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Count, Q
 from django.contrib.auth.hashers import check_password
-from .models import QueueItem, QueueStatus, JobsBms, ShiftClosure, Members
-from .utils import sync_jobs_from_mssql, get_hostname_from_ip, get_client_ip 
+from .models import QueueItem, QueueStatus, JobsBms, ShiftClosure, Members, QueueDoneMonthly, QueueEvent
+from .utils import sync_jobs_from_mssql, get_hostname_from_ip, get_client_ip, get_sync_freshness, request_sync
 # การ Sync ข้อมูลถูกจัดการโดย management command แล้ว: python manage.py import_job_analysis
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from . import dashboard_cache, events, metrics, queue_log
+from django.db import transaction
+import hashlib
 import json
 import socket
+from datetime import timedelta
 
 from .scheduler import auto_close_shift_logic
 
-def dashboard(request):
+def get_actor(request):
+    """ ผู้ทำรายการสำหรับ QueueEvent: ชื่อ Member ที่ล็อกอิน ถ้าไม่มีใช้ชื่อเครื่อง/IP """
+    full_name = f"{request.session.get('first_name', '')} {request.session.get('last_name', '')}".strip()
+    if full_name:
+        return full_name
+    client_ip = get_client_ip(request)
+    return get_hostname_from_ip(client_ip) or client_ip or 'unknown'
+
+def month_range(now):
+    """ คืนค่า (วันแรกของเดือนนี้ 00:00, วันแรกของเดือนถัดไป 00:00) สำหรับกรองแบบช่วงวันที่ """
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    return month_start, next_month_start
+
+# จำนวนรายการต่อหน้าของตารางคิวบน Dashboard
+QUEUE_PAGE_SIZE = 5
+
+def attach_job_info(queue_items):
     """
-    View Function: dashboard
-    หน้าที่: แสดงหน้าจอหลักของระบบคิว (Dashboard)
-    - แสดงจำนวนคิวแต่ละสถานะ
-    - แสดงรายการคิวที่รอ (Waiting) และกำลังดำเนินการ (Active)
-    - ตรวจสอบสิทธิ์ Admin (Based on Hostname/IP)
-    - ตรวจสอบเวลาปิดกะอัตโนมัติ (Auto-close Logic)
+    ดึง JobsBms ของคิวที่จะแสดงรวดเดียว (ลดการยิง DB แบบ N+1) แล้วแนบชื่อช่างและหมายเหตุ BMS ไว้กับแต่ละคิว
+    """
+    queue_items = [item for item in queue_items if item]
+    linked_job_nos = {item.linked_job_no for item in queue_items if item.linked_job_no}
+    jobs_dict = {job.jobno: job for job in JobsBms.objects.filter(jobno__in=linked_job_nos)} if linked_job_nos else {}
+    for queue_item in queue_items:
+        job = jobs_dict.get(queue_item.linked_job_no)
+        queue_item.operator_name = job.name if job else None
+        # แคช note ไว้ใน attribute ชั่วคราวเพื่อให้ models.py หยิบไปใช้ได้โดยไม่ต้อง query ใหม่
+        queue_item._cached_bms_note = job.note if job else ''
+
+def build_dashboard_summary(now):
+    """
+    ส่วนบนของ Dashboard ที่เหมือนกันทุกหน้าจอ: จำนวนแต่ละสถานะ, คิวปัจจุบัน, คิวแทรก, สถานะกะ
+    คืนค่า dict ที่ Cache ได้ (ดู dashboard_cache.py)
     """
-    # query ข้อมูลจาก QueueItem
-    items = QueueItem.objects.all()
+    items = QueueItem.objects.select_related('status')
     
-    # นับจำนวนตามสถานะต่างๆ เพื่อแสดงบนการ์ดด้านบน
-    now = timezone.now()
-    waiting_count = items.filter(status__code='WAITING').count()
-    active_count = items.filter(status__code='ACTIVE').count()
-    done_count = items.filter(status__code='DONE', created_at__month=now.month, created_at__year=now.year).count()
-    coordinating_count = items.filter(status__code='COORDINATING').count()
-    waiting_parts_count = items.filter(status__code='WAITING_PARTS').count()
+    # นับจำนวนตามสถานะต่างๆ เพื่อแสดงบนการ์ดด้านบน (Query เดียวด้วย Count แบบมีเงื่อนไข แทนการนับทีละสถานะ)
+    # กรองเฉพาะสถานะที่นับ ไม่ให้ต้องอ่านคิวที่เสร็จแล้วย้อนหลังทั้งหมด (ใช้ Index ของ status)
+    summary = items.filter(status__code__in=['WAITING', 'ACTIVE', 'COORDINATING', 'WAITING_PARTS']).aggregate(
+        waiting_count=Count('id', filter=Q(status__code='WAITING')),
+        active_count=Count('id', filter=Q(status__code='ACTIVE')),
+        coordinating_count=Count('id', filter=Q(status__code='COORDINATING')),
+        waiting_parts_count=Count('id', filter=Q(status__code='WAITING_PARTS')),
+    )
+    # งานที่เสร็จเดือนนี้: อ่านจาก Rollup รายเดือน (ดู QueueDoneMonthly) และใช้ช่วงวันที่แทน __month/__year ให้ใช้ Index ได้
+    month_start, _ = month_range(now)
+    summary['done_count'] = QueueDoneMonthly.objects.filter(month=month_start.date()).values_list('done_count', flat=True).first() or 0
     
     # Fetch specific statuses for the dropdown (Waiting, Coordinating, Waiting Parts)
     target_codes = ['WAITING', 'COORDINATING', 'WAITING_PARTS']
-    all_statuses = QueueStatus.objects.filter(code__in=target_codes).order_by('id')
+    summary['all_statuses'] = list(QueueStatus.objects.filter(code__in=target_codes).order_by('id'))
     
     # คิวที่กำลังเรียกอยู่ปัจจุบัน (Normal Queue)
-    current_queue = items.filter(status__code='ACTIVE', is_adhoc=0).order_by('created_at').first()
+    summary['current_queue'] = items.filter(status__code='ACTIVE', is_adhoc=0).order_by('created_at').first()
     
     # คิวแทรก (Ad-hoc) ที่กำลัง Active (ถ้ามี จะแสดงแทรกขึ้นมา)
-    current_adhoc = items.filter(status__code='ACTIVE', is_adhoc=1).order_by('created_at').first()
+    summary['current_adhoc'] = items.filter(status__code='ACTIVE', is_adhoc=1).order_by('created_at').first()
+    attach_job_info([summary['current_queue'], summary['current_adhoc']])
 
-    # เราจะจัดการ Operator name หลังจากการแบ่งหน้า (Pagination) เพื่อให้ Query เฉพาะหน้าที่แสดงผล
-    status_filter = request.GET.get('status', 'waiting') # รับค่าจาก URL parameter
-    search_query = request.GET.get('q', '') # รับค่าค้นหา
+    # --- สรุปสถานะการปิดกะเพื่อส่งไปที่ Template ---
+    summary['is_shift_closed'] = ShiftClosure.objects.filter(opened_at__isnull=True).exists()
+    return summary
+
+def build_queue_page(status_filter, search_query, page, now):
+    """
+    ตารางรายการคิวตามตัวกรอง/คำค้นหา/หน้าที่เลือก
+    คืนค่า dict ที่ Cache ได้: items (คิวในหน้านี้ แนบข้อมูลช่าง/ลำดับคิวแล้ว), number, count, list_title
+    """
+    items = QueueItem.objects.select_related('status')
+    month_start, next_month_start = month_range(now)
     
     if status_filter == 'active':
         queue_list = items.filter(status__code='ACTIVE').order_by('created_at')
         list_title = "รายการที่กำลังดำเนินการ (Active)"
     elif status_filter == 'done':
         # เรียงลำดับคิวที่เสร็จแล้ว เอาที่เพิ่งเสร็จขึ้นก่อน (อิงจาก created_at หรือถ้าเพิ่ม updated_at ค่อยแก้ภายหลัง) 
-        queue_list = items.filter(status__code='DONE', created_at__month=now.month, created_at__year=now.year).order_by('created_at')
+        queue_list = items.filter(status__code='DONE', created_at__gte=month_start, created_at__lt=next_month_start).order_by('created_at')
         list_title = "รายการที่เสร็จสิ้น (Done)"
     elif status_filter == 'pending':
         queue_list = items.filter(status__code__in=['COORDINATING', 'WAITING_PARTS']).order_by('created_at')
         list_title = "รายการที่อยู่ระหว่างประสานงานและรออะไหล่"
     elif status_filter == 'waiting':
-        # เรียงตามความเร่งด่วน (urgent) ก่อน แล้วค่อยตามเลขคิว
-        queue_list = items.filter(status__code='WAITING').order_by('-is_urgent', 'queue_number')
+        # เรียงตามความเร่งด่วน (urgent) ก่อน แล้วค่อยตามลำดับการออกเลขคิว (id แทน String เลขคิว ที่เรียง IT-10000 ก่อน IT-9999)
+        queue_list = items.filter(status__code='WAITING').order_by('-is_urgent', 'id')
         list_title = "รายการที่รอคิว (Waiting)"
     else:
-        queue_list = items.filter(status__code='WAITING').order_by('-is_urgent', 'queue_number')
+        queue_list = items.filter(status__code='WAITING').order_by('-is_urgent', 'id')
         list_title = "รายการที่รอคิว (Waiting)"
 
     # --- Logic การค้นหา (Search) ---
@@ -78,51 +126,79 @@ def dashboard(request):
             )
 
     # --- Logic การแบ่งหน้า (Pagination) ---
-    paginator = Paginator(queue_list, 5) # แสดง 5 รายการต่อหน้า
-    page = request.GET.get('page')
+    paginator = Paginator(queue_list, QUEUE_PAGE_SIZE)
     try:
-        queue_list = paginator.page(page)
+        queue_page = paginator.page(page)
     except PageNotAnInteger:
-        queue_list = paginator.page(1)
+        queue_page = paginator.page(1)
     except EmptyPage:
-        queue_list = paginator.page(paginator.num_pages)
+        queue_page = paginator.page(paginator.num_pages)
+    page_items = list(queue_page.object_list)
 
     # --- Logic การจัดลำดับคิว (Ranking) ---
     # คำนวณลำดับคิวจริงๆ (ไม่นับ Pagination) เพื่อแสดงผลในตาราง
     if status_filter == 'waiting':
         try:
-             all_waiting_ids = list(QueueItem.objects.filter(status__code='WAITING').order_by('-is_urgent', 'queue_number').values_list('id', flat=True))
+             all_waiting_ids = list(QueueItem.objects.filter(status__code='WAITING').order_by('-is_urgent', 'id').values_list('id', flat=True))
              rank_map = {pk: i+1 for i, pk in enumerate(all_waiting_ids)}
              
-             for item in queue_list:
+             for item in page_items:
                  item.waiting_rank = rank_map.get(item.id, '-')
         except Exception as e:
             print(f"Error calculating ranks: {e}")
 
-    # --- Optimize N+1 Query การดึงชื่อช่างและหมายเหตุ BMS ---
-    linked_job_nos = set()
-    for item in queue_list:
-        if item.linked_job_no:
-            linked_job_nos.add(item.linked_job_no)
-    if current_queue and current_queue.linked_job_no:
-        linked_job_nos.add(current_queue.linked_job_no)
-    if current_adhoc and current_adhoc.linked_job_no:
-        linked_job_nos.add(current_adhoc.linked_job_no)
-        
-    # ดึง JobsBms รวดเดียวทีเดียว (เฉพาะที่มีในหน้านี้) ลดการยิง DB แบบ N+1
-    jobs_dict = {job.jobno: job for job in JobsBms.objects.filter(jobno__in=linked_job_nos)}
+    # --- Optimize N+1 Query การดึงชื่อช่างและหมายเหตุ BMS (เฉพาะหน้าที่แสดงผล) ---
+    attach_job_info(page_items)
+    return {
+        'items': page_items,
+        'number': queue_page.number,
+        'count': paginator.count,
+        'list_title': list_title,
+    }
+
+# ส่วนของ Dashboard ที่ Render แยกได้ (ชื่อ -> Partial template) ใช้ทั้งตอนแสดงหน้าเต็มและใน /api/dashboard/
+DASHBOARD_SECTIONS = {
+    'freshness': 'queue_app/partials/sync_freshness.html',
+    'current': 'queue_app/partials/current_queue.html',
+    'list_actions': 'queue_app/partials/queue_list_actions.html',
+    'list_body': 'queue_app/partials/queue_list_body.html',
+}
+
+def render_dashboard_sections(request, context):
+    """
+    Render ทุกส่วนใน DASHBOARD_SECTIONS คืนค่า {ชื่อ: {'key': ..., 'html': ...}}
+    key คือ Hash ของ HTML ฝั่ง Browser ส่งกลับมาเทียบ ถ้าตรงกันแปลว่าส่วนนั้นไม่เปลี่ยน ไม่ต้องส่ง HTML ซ้ำ
+    """
+    sections = {}
+    for name, template_name in DASHBOARD_SECTIONS.items():
+        html = render_to_string(template_name, context, request=request)
+        sections[name] = {
+            'key': hashlib.md5(html.encode('utf-8')).hexdigest()[:12],
+            'html': mark_safe(html),
+        }
+    return sections
+
+def get_dashboard_context(request):
+    """
+    รวบรวมข้อมูลของหน้า Dashboard (ใช้ร่วมกันระหว่าง dashboard และ dashboard_api)
+    ข้อมูลคิวอ่านจาก Cache ตามเวอร์ชันของคิว (ดู dashboard_cache.py) คำนวณใหม่เมื่อมีการเปลี่ยนแปลงเท่านั้น
+    """
+    now = timezone.now()
+    month_start, _ = month_range(now)
+    status_filter = request.GET.get('status', 'waiting') # รับค่าจาก URL parameter
+    search_query = request.GET.get('q', '') # รับค่าค้นหา
+    page = request.GET.get('page')
     
-    def attach_job_info(queue_item):
-        if queue_item:
-            job = jobs_dict.get(queue_item.linked_job_no)
-            queue_item.operator_name = job.name if job else None
-            # แคช note ไว้ใน attribute ชั่วคราวเพื่อให้ models.py หยิบไปใช้ได้โดยไม่ต้อง query ใหม่
-            queue_item._cached_bms_note = job.note if job else ''
-
-    attach_job_info(current_queue)
-    attach_job_info(current_adhoc)
-    for item in queue_list:
-        attach_job_info(item)
+    # ใช้เวอร์ชันเดียวกับที่ dashboard_etag อ่านไว้ เนื้อหาที่ตอบจึงตรงกับ ETag เสมอ
+    version = getattr(request, 'dashboard_version', None)
+    summary = dashboard_cache.get_or_build('summary', (month_start,), lambda: build_dashboard_summary(now), version=version)
+    listing = dashboard_cache.get_or_build(
+        'queue_list', (status_filter, search_query, page, month_start),
+        lambda: build_queue_page(status_filter, search_query, page, now),
+        version=version,
+    )
+    # สร้าง Page จากผลที่ Cache ไว้ (Paginator นับจาก count ที่เก็บไว้ ไม่ Query ซ้ำ)
+    queue_list = Page(listing['items'], listing['number'], Paginator(range(listing['count']), QUEUE_PAGE_SIZE))
 
     # --- ตรวจสอบสิทธิ์ Admin ---
     is_admin_computer = False
@@ -150,35 +226,126 @@ def dashboard(request):
 
     # --- ลบออก: ไม่ต้องรัน Auto-Close ใน View แล้ว ให้ Scheduler เบื้องหลังทำงานแทนเพื่อประหยัดทรัพยากร ---
 
-    # --- สรุปสถานะการปิดกะเพื่อส่งไปที่ Template ---
-    is_shift_closed = ShiftClosure.objects.filter(opened_at__isnull=True).exists()
-    
     first_name = request.session.get('first_name', '')
     last_name = request.session.get('last_name', '')
     full_name = f"{first_name} {last_name}".strip()
 
     context = {
-        'waiting_count': waiting_count,
-        'active_count': active_count,
-        'done_count': done_count,
-        'coordinating_count': coordinating_count,
-        'waiting_parts_count': waiting_parts_count,
-        'current_queue': current_queue,
+        'waiting_count': summary['waiting_count'],
+        'active_count': summary['active_count'],
+        'done_count': summary['done_count'],
+        'coordinating_count': summary['coordinating_count'],
+        'waiting_parts_count': summary['waiting_parts_count'],
+        'current_queue': summary['current_queue'],
         'queue_list': queue_list,
-        'list_title': list_title,
+        'list_title': listing['list_title'],
         'active_filter': status_filter,
         'search_query': search_query,
         'is_admin_computer': is_admin_computer,
-        'all_statuses': all_statuses,
-        'current_adhoc': current_adhoc,
-        'is_shift_closed': is_shift_closed,
+        'all_statuses': summary['all_statuses'],
+        'current_adhoc': summary['current_adhoc'],
+        'is_shift_closed': summary['is_shift_closed'],
         'client_ip': client_ip,
         'client_hostname': hostname,
         'logged_in_member': full_name if full_name else None,
+        # สถานะข้อมูลจาก BMS เปลี่ยนทุกรอบ Sync (ไม่ผูกกับเวอร์ชันของคิว) จึง Cache แค่ช่วงสั้นๆ
+        'sync_freshness': get_dashboard_freshness(request),
     }
-    
+    return context
+
+def get_dashboard_freshness(request):
+    """
+    สถานะข้อมูลจาก BMS ของ Request นี้ อ่านจาก Cache ครั้งเดียวแล้วเก็บไว้ที่ request
+    (dashboard_etag และ get_dashboard_context จึงใช้ค่าเดียวกัน แม้ Cache จะหมดอายุระหว่าง Request)
+    """
+    if not hasattr(request, 'dashboard_freshness'):
+        request.dashboard_freshness = dashboard_cache.get_or_build(
+            'sync_freshness', (), get_sync_freshness, timeout=settings.BMS_SYNC_TICK,
+        )
+    return request.dashboard_freshness
+
+def dashboard_etag(request, *args, **kwargs):
+    """
+    ETag ของหน้า Dashboard และ /api/dashboard/ คำนวณจากค่าใน Cache อย่างเดียว (ไม่ Query/Render)
+    ถ้าตรงกับ If-None-Match ที่ Browser ส่งมา จะตอบ 304 Not Modified ทันที
+    - เวอร์ชันของคิว (เปลี่ยนทุกครั้งที่มีการเขียนข้อมูลคิว ดู dashboard_cache.py) และเดือนปัจจุบัน (ตัวเลขเสร็จสิ้นเดือนนี้)
+    - Path และพารามิเตอร์ทั้งหมด (status, q, page และ have ของ API)
+    - สิทธิ์/ผู้ใช้ใน Session และ IP ของเครื่อง (ปุ่ม Admin และข้อมูลเครื่องต่างกันตามผู้เปิด)
+    - เวลาที่ Sync สำเร็จล่าสุด และสถานะข้อมูลค้าง (แสดงบนหน้าจอ แต่ไม่ผูกกับเวอร์ชันของคิว)
+      ถ้าข้อมูลค้าง หน้าจอแสดงอายุข้อมูลเป็นนาที จึงรวมจำนวนนาทีไว้ด้วย ETag จะเปลี่ยนทุกนาทีจนกว่าจะ Sync สำเร็จ
+    """
+    # เก็บเวอร์ชันไว้ที่ request ให้ get_dashboard_context ใช้เวอร์ชันเดียวกันตอน Render
+    # (ถ้าอ่านใหม่ทีหลัง อาจได้เวอร์ชันที่ใหม่กว่า ETag และ Browser จะเก็บเนื้อหาคู่กับ ETag ที่ไม่ตรงกัน)
+    request.dashboard_version = dashboard_cache.get_queue_version()
+    freshness = get_dashboard_freshness(request)
+    parts = (
+        request.dashboard_version,
+        month_range(timezone.now())[0],
+        request.path,
+        sorted(request.GET.lists()),
+        request.session.get('is_staff'),
+        request.session.get('first_name', ''),
+        request.session.get('last_name', ''),
+        get_client_ip(request),
+        freshness['data_as_of'],
+        freshness['stale'],
+        freshness['age_minutes'] if freshness['stale'] else None,
+    )
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+def dashboard_conditional(view):
+    """
+    Decorator: ตอบ 304 ตาม dashboard_etag และบีบอัด Response (gzip) ตาม Accept-Encoding
+    ให้ Browser เก็บผลไว้ได้ (เฉพาะเครื่องตัวเอง) แต่ต้องถาม Server ด้วย If-None-Match ทุกครั้งก่อนใช้
+    (ไม่ใช้ GZipMiddleware ทั้งระบบ เพราะ gzip ของ Stream จะกักข้อความของ /events/ ไว้ใน Buffer ไม่ส่งทันที)
+    """
+    return gzip_page(cache_control(private=True, no_cache=True)(condition(etag_func=dashboard_etag)(view)))
+
+@metrics.timed_view
+@dashboard_conditional
+def dashboard(request):
+    """
+    View Function: dashboard
+    หน้าที่: แสดงหน้าจอหลักของระบบคิว (Dashboard)
+    - แสดงจำนวนคิวแต่ละสถานะ
+    - แสดงรายการคิวที่รอ (Waiting) และกำลังดำเนินการ (Active)
+    - ตรวจสอบสิทธิ์ Admin (Based on Hostname/IP)
+    - ตรวจสอบเวลาปิดกะอัตโนมัติ (Auto-close Logic)
+    """
+    context = get_dashboard_context(request)
+    context['sections'] = render_dashboard_sections(request, context)
     return render(request, 'queue_app/dashboard.html', context)
 
+@metrics.timed_view
+@dashboard_conditional
+def dashboard_api(request):
+    """
+    API: ข้อมูลของหน้า Dashboard แบบ JSON สำหรับอัปเดตหน้าจอที่เปิดอยู่โดยไม่โหลดทั้งหน้า
+    - counts: ตัวเลขสรุปแต่ละสถานะ
+    - sections: HTML ของแต่ละส่วน (คิวปัจจุบัน/คิวแทรก, ปุ่มของรายการ, รายการคิว 1 หน้า, สถานะข้อมูล BMS)
+      รับพารามิเตอร์ status/q/page แบบเดียวกับหน้า Dashboard
+      และ have=<ชื่อ>:<key> (ส่งได้หลายค่า) ส่วนที่ key ตรงกับที่ Browser มีอยู่จะส่งแค่ key ไม่ส่ง HTML
+    """
+    context = get_dashboard_context(request)
+    have = dict(value.split(':', 1) for value in request.GET.getlist('have') if ':' in value)
+    sections = {}
+    for name, section in render_dashboard_sections(request, context).items():
+        if have.get(name) == section['key']:
+            sections[name] = {'key': section['key']}
+        else:
+            sections[name] = {'key': section['key'], 'html': str(section['html'])}
+    return JsonResponse({
+        'version': request.dashboard_version,
+        'counts': {
+            'waiting': context['waiting_count'],
+            'active': context['active_count'],
+            'done': context['done_count'],
+            'pending': context['coordinating_count'] + context['waiting_parts_count'],
+        },
+        'is_shift_closed': context['is_shift_closed'],
+        'sections': sections,
+    })
+
 @csrf_exempt
 def update_job_description(request):
     """
@@ -191,7 +358,9 @@ def update_job_description(request):
             comment = data.get('comment') # หมายเหตุที่ user พิมพ์มา
             status_id = data.get('status_id') # สถานะใหม่ที่ user เลือก
             
-            queue_item = QueueItem.objects.get(id=item_id)
+            queue_item = QueueItem.objects.select_related('status').get(id=item_id)
+            old_comment = queue_item.comment
+            old_status = queue_item.status
             queue_item.comment = comment
             
             if status_id:
@@ -201,7 +370,20 @@ def update_job_description(request):
                 except QueueStatus.DoesNotExist:
                     pass
             
-            queue_item.save()
+            actor = get_actor(request)
+            changes = []
+            if (old_comment or '') != (comment or ''):
+                changes.append(queue_log.new_event(queue_item, QueueEvent.EVENT_COMMENT, actor, old_comment, comment))
+            if queue_item.status != old_status:
+                changes.append(queue_log.new_event(
+                    queue_item, QueueEvent.EVENT_STATUS, actor,
+                    queue_log.status_code(old_status), queue_log.status_code(queue_item.status),
+                ))
+            with transaction.atomic():
+                queue_log.lock_event_log()
+                queue_item.save()
+                queue_log.record_events(changes)
+            dashboard_cache.bump_queue_version()
             return JsonResponse({'success': True})
         except QueueItem.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Queue Item not found'})
@@ -228,8 +410,17 @@ def toggle_urgent_status(request):
                 urgent_val = 0
             
             queue_item = QueueItem.objects.get(id=item_id)
+            old_urgent = queue_item.is_urgent
             queue_item.is_urgent = urgent_val
-            queue_item.save()
+            actor = get_actor(request)
+            with transaction.atomic():
+                queue_log.lock_event_log()
+                queue_item.save()
+                if old_urgent != urgent_val:
+                    queue_log.record_events([
+                        queue_log.new_event(queue_item, QueueEvent.EVENT_URGENT, actor, old_urgent, urgent_val)
+                    ])
+            dashboard_cache.bump_queue_version()
             
             return JsonResponse({'success': True})
         except QueueItem.DoesNotExist:
@@ -278,18 +469,26 @@ def call_next_queue(request):
             except JobsBms.DoesNotExist:
                 pass
 
-    # 2. ปิดงานเก่า (ถ้าผ่าน Validation)
-    for item in current_active_items:
-        item.status = done_status
-        item.save()
+    actor = get_actor(request)
+    changes = []
+    with transaction.atomic():
+        queue_log.lock_event_log()
+        # 2. ปิดงานเก่า (ถ้าผ่าน Validation)
+        for item in current_active_items:
+            item.status = done_status
+            item.save()
+            changes.append(queue_log.new_event(item, QueueEvent.EVENT_STATUS, actor, active_status.code, done_status.code))
+        
+        # 3. เรียกคิวถัดไป (Priority: Urgent > Normal, แล้วเรียงตามเลขคิว)
+        next_item = QueueItem.objects.filter(status=waiting_status).order_by('-is_urgent', 'id').first()
+        if next_item:
+            next_item.status = active_status
+            next_item.call_queue_date = timezone.now() # บันทึกเวลาที่เรียกคิว
+            next_item.save()
+            changes.append(queue_log.new_event(next_item, QueueEvent.EVENT_STATUS, actor, waiting_status.code, active_status.code))
+        queue_log.record_events(changes)
     
-    # 3. เรียกคิวถัดไป (Priority: Urgent > Normal, แล้วเรียงตามเลขคิว)
-    next_item = QueueItem.objects.filter(status=waiting_status).order_by('-is_urgent', 'queue_number').first()
-    if next_item:
-        next_item.status = active_status
-        next_item.call_queue_date = timezone.now() # บันทึกเวลาที่เรียกคิว
-        next_item.save()
-            
+    dashboard_cache.bump_queue_version()
     return JsonResponse({'success': True})
 
 def finish_current_queue(request):
@@ -306,10 +505,17 @@ def finish_current_queue(request):
     # ดึงรายการที่กำลัง Active อยู่ตอนนี้ (เฉพาะ Normal)
     current_items = QueueItem.objects.filter(status=active_status, is_adhoc=0)
     
-    for item in current_items:
-        item.status = done_status
-        item.save()
-        
+    actor = get_actor(request)
+    changes = []
+    with transaction.atomic():
+        queue_log.lock_event_log()
+        for item in current_items:
+            item.status = done_status
+            item.save()
+            changes.append(queue_log.new_event(item, QueueEvent.EVENT_STATUS, actor, active_status.code, done_status.code))
+        queue_log.record_events(changes)
+    
+    dashboard_cache.bump_queue_version()
     return redirect('dashboard')
 
 @csrf_exempt
@@ -334,14 +540,23 @@ def insert_queue_adhoc(request):
                 })
             
             # 2. ดึงข้อมูลคิวที่ต้องการแทรก
-            queue_item = QueueItem.objects.get(id=item_id)
+            queue_item = QueueItem.objects.select_related('status').get(id=item_id)
+            old_status = queue_item.status
             
             # 3. อัปเดตสถานะเป็น ACTIVE
             queue_item.status = active_status
             queue_item.call_queue_date = timezone.now() # บันทึกเวลาที่เรียกคิว
             queue_item.is_adhoc = 1 # Mark ว่าเป็นคิวที่ถูกแทรก
             
-            queue_item.save()
+            actor = get_actor(request)
+            with transaction.atomic():
+                queue_log.lock_event_log()
+                queue_item.save()
+                queue_log.record_events([queue_log.new_event(
+                    queue_item, QueueEvent.EVENT_STATUS, actor,
+                    queue_log.status_code(old_status), active_status.code, {'is_adhoc': 1},
+                )])
+            dashboard_cache.bump_queue_version()
             
             return JsonResponse({'success': True})
             
@@ -383,10 +598,18 @@ def finish_adhoc_queue(request):
 
     # 2. ปิดงาน (ถ้าผ่าน Validation)
     updated_count = 0
-    for item in current_items:
-        item.status = done_status
-        item.save()
-        updated_count += 1
+    actor = get_actor(request)
+    changes = []
+    with transaction.atomic():
+        queue_log.lock_event_log()
+        for item in current_items:
+            item.status = done_status
+            item.save()
+            changes.append(queue_log.new_event(item, QueueEvent.EVENT_STATUS, actor, active_status.code, done_status.code))
+            updated_count += 1
+        queue_log.record_events(changes)
+    if updated_count:
+        dashboard_cache.bump_queue_version()
         
     if updated_count == 0 and not current_items.exists():
          # กรณีไม่มีรายการ (อาจจะถูกปิดไปแล้ว)
@@ -432,7 +655,10 @@ def toggle_shift_status(request):
                         opened_at=now,
                         opened_by=hostname
                     )
+                # ระหว่างปิดกะ Sync ถูกยืดรอบออก เปิดกะแล้วให้ Sync ทันที
+                request_sync()
                 is_closed = False
+            dashboard_cache.bump_queue_version()
             
             return JsonResponse({
                 'success': True, 
@@ -455,7 +681,7 @@ def close_queue_item(request):
             data = json.loads(request.body)
             item_id = data.get('id')
             
-            queue_item = QueueItem.objects.get(id=item_id)
+            queue_item = QueueItem.objects.select_related('status').get(id=item_id)
             done_status = QueueStatus.objects.get(code='DONE')
             
             # 1. Validation Logic: ตรวจสอบสถานะ BMS
@@ -471,8 +697,17 @@ def close_queue_item(request):
                     pass
 
             # 2. ปิดงาน
+            old_status = queue_item.status
             queue_item.status = done_status
-            queue_item.save()
+            actor = get_actor(request)
+            with transaction.atomic():
+                queue_log.lock_event_log()
+                queue_item.save()
+                queue_log.record_events([queue_log.new_event(
+                    queue_item, QueueEvent.EVENT_STATUS, actor,
+                    queue_log.status_code(old_status), done_status.code,
+                )])
+            dashboard_cache.bump_queue_version()
             
             return JsonResponse({'success': True})
             
@@ -520,3 +755,78 @@ def logout_member(request):
         request.session.flush()
         return JsonResponse({'success': True})
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+@gzip_page
+def queue_changes(request):
+    """
+    API: Delta feed ของคิว - คืนเฉพาะ QueueEvent ที่เกิดหลังเวอร์ชันที่ Client มีอยู่
+    - ?since=<version>: คืน Event ที่ version (id) มากกว่านี้ เรียงตามลำดับ ครั้งละไม่เกิน QUEUE_CHANGES_PAGE_SIZE
+      ถ้า has_more เป็น true ให้ขอต่อด้วย since=<version ที่ได้กลับไป>
+    - ไม่ส่ง since: คืนเวอร์ชันล่าสุดอย่างเดียว (ใช้ตั้งต้นหลังโหลดข้อมูลทั้งหมดจาก /api/dashboard/)
+    """
+    since = request.GET.get('since')
+    if since is None:
+        latest = QueueEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        return JsonResponse({'version': latest, 'events': [], 'has_more': False})
+    try:
+        since = int(since)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'since must be an integer version'}, status=400)
+
+    page_size = settings.QUEUE_CHANGES_PAGE_SIZE
+    changes = list(QueueEvent.objects.filter(id__gt=since).order_by('id')[:page_size + 1])
+    has_more = len(changes) > page_size
+    changes = changes[:page_size]
+    return JsonResponse({
+        'version': changes[-1].id if changes else since,
+        'events': [queue_log.serialize_event(event) for event in changes],
+        'has_more': has_more,
+    })
+
+def trigger_sync(request):
+    """
+    API: ขอให้ Sync ข้อมูลจาก BMS ทันที (ไม่ต้องรอรอบ)
+    Scheduler (Leader) จะ Sync ภายใน BMS_SYNC_TICK วินาที แล้วเข้าโหมด Burst ชั่วคราว
+    เฉพาะเจ้าหน้าที่ที่ล็อกอินแล้ว (Session is_staff) และต้องส่ง CSRF token มาด้วย (Header X-CSRFToken)
+    """
+    if request.session.get('is_staff') != 1:
+        return JsonResponse({'success': False, 'error': 'Staff login required'}, status=403)
+    if request.method == 'POST':
+        request_sync()
+        return JsonResponse({'success': True})
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+def queue_events(request):
+    """
+    API: Server-Sent Events ของการเปลี่ยนแปลงคิว (ดู events.py)
+    หน้า Dashboard เปิดค้างไว้ด้วย EventSource แล้วโหลดข้อมูลใหม่เมื่อได้รับ event: queue เท่านั้น
+    """
+    response = StreamingHttpResponse(events.queue_event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # ไม่ให้ Reverse proxy (เช่น nginx) Buffer ข้อความไว้
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics_view(request):
+    """
+    API: สถิติของระบบในรูปแบบ Prometheus (เวลาแต่ละขั้นตอนของ Sync, จำนวนแถว, Error, เวลาตอบสนองของ Dashboard)
+    หมายเหตุ: ถ้า Sync รันแยกใน run_scheduler ให้ดึงสถิติการ Sync จาก --metrics-port ของ Process นั้น
+    """
+    return HttpResponse(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def health_view(request):
+    """
+    API: ตรวจสุขภาพระบบสำหรับ Monitoring (JSON)
+    - ok = False (HTTP 503) ถ้าไม่มีการ Sync ที่สำเร็จภายใน SYNC_STALE_AFTER วินาที
+    """
+    freshness = get_sync_freshness()
+    data = {
+        'ok': not freshness['stale'],
+        'data_as_of': freshness['data_as_of'].isoformat() if freshness['data_as_of'] else None,
+        'age_seconds': freshness['age_seconds'],
+        'stale_after_seconds': settings.SYNC_STALE_AFTER,
+        'last_run_at': freshness['last_run_at'].isoformat() if freshness['last_run_at'] else None,
+        'last_run_success': freshness['last_run_success'],
+        'last_error': freshness['last_error'],
+    }
+    return JsonResponse(data, status=200 if data['ok'] else 503)